@@ -13,9 +13,42 @@ def generate_session_code():
     """Generate random 6-character alphanumeric code"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+def validate_session(robot_id, session_code, headers):
+    """
+    Tell a rebooted robot whether its cached session can still be used:
+    it must exist, belong to the robot, be unexpired and still be waiting
+    for a VR client (status 'active')
+    """
+    response = sessions_table.get_item(Key={'session_code': session_code})
+    session = response.get('Item')
+    current_time_ms = int(time.time() * 1000)
+    
+    if session is None:
+        valid, reason = False, 'not_found'
+    elif session.get('robot_id') != robot_id:
+        valid, reason = False, 'wrong_robot'
+    elif int(session.get('expires_at', 0)) <= current_time_ms:
+        valid, reason = False, 'expired'
+    elif session.get('status') != 'active':
+        valid, reason = False, session.get('status', 'unknown')
+    else:
+        valid, reason = True, 'active'
+    
+    print(f"Session {session_code} for {robot_id}: {'valid' if valid else 'invalid'} ({reason})")
+    
+    body = {'success': True, 'valid': valid, 'reason': reason, 'server_time': current_time_ms}
+    if valid:
+        body.update({
+            'session_code': session_code,
+            'expires_at': int(session['expires_at']),
+            'agora_channel': session.get('agora_channel', f"jethexa_{session_code}")
+        })
+    return {'statusCode': 200, 'headers': headers, 'body': json.dumps(body)}
+
 def lambda_handler(event, context):
     """
-    Register a new robot session and return 6-digit code
+    Register a new robot session and return 6-digit code,
+    or with {"action": "validate", "session_code": ...} check a cached one
     """
     
     # CORS headers
@@ -35,6 +68,16 @@ def lambda_handler(event, context):
         body = json.loads(event.get('body', '{}'))
         robot_id = body.get('robot_id', 'jethexa_unknown')
         
+        if body.get('action') == 'validate':
+            session_code = body.get('session_code')
+            if not session_code:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'success': False, 'error': 'session_code is required'})
+                }
+            return validate_session(robot_id, str(session_code), headers)
+        
         # Generate unique session code
         session_code = generate_session_code()
         
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""Offline benchmark for LidarController perception
+
+Feeds LaserScan-shaped inputs through LidarController.lidar_callback with
+ROS and the jethexa controller client replaced by in-process stand-ins and
+KEY2 on the fake GPIO backend, and reports per-scan latency (p50/p99),
+transient allocations and the decisions taken for every running mode, along
+with the mean forward speed they ask for, how many of them walk forward
+with a return closer than NEAR_COLLISION straight ahead and the share of
+scans skipped as unchanged (the previous decision keeps running for those).
+
+    python3 scripts/bench_lidar.py                      # all synthetic scenes
+    python3 scripts/bench_lidar.py --scans run1.npz     # add recorded captures
+    python3 scripts/bench_lidar.py --json out.json      # machine-readable report
+    python3 scripts/bench_lidar.py --capture run1.npz   # record /scan (needs ROS)
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+BEAMS = 720
+RANGE_MIN = 0.1
+RANGE_MAX = 12.0
+# A decision that walks forward with a return this close ahead counts as a near collision
+NEAR_COLLISION = 0.25
+
+
+# --- Stand-ins for ROS and the controller client ----------------------------
+
+class _Msg:
+    """Accepts any constructor kwargs and stores them as attributes"""
+
+    def __init__(self, *args, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _Vector3:
+    def __init__(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.z = 0.0
+
+
+class _Twist:
+    def __init__(self):
+        self.linear = _Vector3()
+        self.angular = _Vector3()
+
+
+class _Publisher:
+    def __init__(self, *args, **kwargs):
+        self.name = args[0] if args else ""
+
+    def publish(self, msg):
+        pass
+
+    def get_num_connections(self):
+        return 0
+
+
+class _Stamp:
+    def is_zero(self):
+        return True
+
+
+class _PID:
+    def __init__(self, p, i, d):
+        self.kp, self.ki, self.kd = p, i, d
+        self.clear()
+
+    def clear(self):
+        self.integral = 0.0
+        self.last_error = 0.0
+        self.output = 0.0
+
+    def update(self, error):
+        self.integral += error
+        self.output = self.kp * error + self.ki * self.integral + self.kd * (error - self.last_error)
+        self.last_error = error
+
+
+class _Client:
+    def __init__(self, node):
+        self.cmd_vel_pub = _Publisher()
+
+    def traveling(self, **kwargs):
+        pass
+
+    def cmd_vel(self, x, y, z):
+        pass
+
+
+class ROSException(Exception):
+    pass
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install_stubs(params):
+    """Register stand-in modules for everything lidar_controller imports from ROS"""
+    noop = lambda *args, **kwargs: None
+
+    def wait_for_service(*args, **kwargs):
+        raise ROSException("offline benchmark")
+
+    rospy = _module(
+        "rospy",
+        init_node=noop, loginfo=noop, logwarn=noop, logerr=noop, logdebug=noop,
+        get_param=lambda name, default=None: params.get(name.lstrip("~"), default),
+        Service=_Msg, ServiceProxy=_Msg, Subscriber=_Msg, Publisher=_Publisher,
+        wait_for_service=wait_for_service, wait_for_message=noop,
+        is_shutdown=lambda: False, on_shutdown=noop, sleep=noop, spin=noop,
+        ROSException=ROSException, Time=types.SimpleNamespace(now=time.time),
+    )
+    rospy.numpy_msg = _module("rospy.numpy_msg", numpy_msg=lambda cls: cls)
+    _module("jethexa_app", Heart=_Msg)
+    sdk = _module("jethexa_sdk")
+    sdk.misc = _module("jethexa_sdk.misc", set_range=lambda v, lo, hi: min(max(v, lo), hi))
+    sdk.pid = _module("jethexa_sdk.pid", PID=_PID)
+    for package, names in (
+        ("geometry_msgs", dict(Twist=_Twist)),
+        ("sensor_msgs", dict(LaserScan=_Msg)),
+        ("nav_msgs", dict(Odometry=_Msg)),
+        ("std_msgs", dict(Float32=_Msg, Float32MultiArray=_Msg, String=_Msg, Bool=_Msg, Empty=_Msg)),
+    ):
+        _module(package).msg = _module(package + ".msg", **names)
+    _module("jethexa_controller").client = _module("jethexa_controller.client", Client=_Client)
+    _module("jethexa_controller_interfaces")
+    _module("jethexa_controller_interfaces.msg", Traveling=_Msg)
+    _module("std_srvs").srv = _module(
+        "std_srvs.srv",
+        Empty=_Msg, Trigger=_Msg, TriggerRequest=_Msg, TriggerResponse=_Msg,
+        SetBool=_Msg, SetBoolRequest=_Msg, SetBoolResponse=_Msg,
+    )
+    sys.modules["jethexa_controller_interfaces"].srv = _module(
+        "jethexa_controller_interfaces.srv",
+        SetInt64=_Msg, SetInt64Request=_Msg, SetInt64Response=_Msg,
+        SetFloat64List=_Msg, SetFloat64ListRequest=_Msg, SetFloat64ListResponse=_Msg,
+    )
+    # KEY2 handling runs on the fake GPIO backend from src/utils/buttons.py
+    os.environ["JETHEXA_FAKE_GPIO"] = "1"
+
+
+# --- Scan sources ------------------------------------------------------------
+
+class Scan:
+    """The LaserScan fields lidar_callback reads; ranges as numpy_msg delivers them"""
+
+    def __init__(self, ranges, angle_min=-math.pi, angle_increment=2 * math.pi / BEAMS,
+                 range_min=RANGE_MIN, range_max=RANGE_MAX, truth=None):
+        self.header = types.SimpleNamespace(stamp=_Stamp())
+        self.angle_min = angle_min
+        self.angle_increment = angle_increment
+        self.range_min = range_min
+        self.range_max = range_max
+        self.ranges = np.asarray(ranges, dtype=np.float32)
+        # Noise-free ranges of synthetic scenes, for the near-collision count
+        self.truth = self.ranges if truth is None else np.asarray(truth, dtype=np.float32)
+
+
+def beam_angles(flip):
+    """Robot-frame direction of each beam (the RPLIDAR is mounted backwards)"""
+    angles = -math.pi + np.arange(BEAMS) * (2 * math.pi / BEAMS)
+    return angles + math.pi if flip else angles
+
+
+def cast(angles, walls=(), circles=()):
+    """Ray-cast from the origin against axis-aligned walls and circles
+
+    walls: (axis, offset) pairs, e.g. ("y", 0.6) is the line y = 0.6.
+    circles: (cx, cy, radius).
+    """
+    c = np.cos(angles)
+    s = np.sin(angles)
+    ranges = np.full(angles.shape, np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis, offset in walls:
+            d = offset / (c if axis == "x" else s)
+            ranges = np.where(d > 0, np.minimum(ranges, d), ranges)
+        for cx, cy, radius in circles:
+            b = c * cx + s * cy
+            disc = b * b - (cx * cx + cy * cy - radius * radius)
+            d = b - np.sqrt(disc)
+            ranges = np.where((disc >= 0) & (d > 0), np.minimum(ranges, d), ranges)
+    ranges[ranges >= RANGE_MAX] = np.inf
+    return ranges
+
+
+def corridor(n, flip, rng):
+    """Walking down a 1.2 m corridor towards an end wall"""
+    angles = beam_angles(flip)
+    return [Scan(cast(angles, walls=[("y", 0.6), ("y", -0.6), ("x", 4.0 - 3.8 * i / n)])) for i in range(n)]
+
+
+def cluttered_room(n, flip, rng):
+    """A 6 x 5 m room with drifting boxes and chair legs"""
+    angles = beam_angles(flip)
+    circles = np.column_stack((rng.uniform(-2.5, 2.5, 12), rng.uniform(-2.0, 2.0, 12), rng.uniform(0.03, 0.3, 12)))
+    drift = rng.normal(0, 0.01, (12, 2))
+    scans = []
+    for i in range(n):
+        moved = circles.copy()
+        moved[:, :2] += drift * i
+        walls = [("x", 3.0), ("x", -3.0), ("y", 2.5), ("y", -2.5)]
+        scans.append(Scan(cast(angles, walls=walls, circles=[tuple(c) for c in moved])))
+    return scans
+
+
+def noisy(n, flip, rng):
+    """Open corridor with range noise, dropouts and single-beam false positives"""
+    angles = beam_angles(flip)
+    base = cast(angles, walls=[("y", 0.8), ("y", -0.8), ("x", 6.0)])
+    scans = []
+    for _ in range(n):
+        ranges = base + rng.normal(0, 0.02, BEAMS)
+        ranges[rng.random(BEAMS) < 0.05] = np.inf
+        ranges[rng.random(BEAMS) < 0.002] = rng.uniform(0.15, 0.5)
+        scans.append(Scan(ranges, truth=base))
+    return scans
+
+
+def standstill(n, flip, rng):
+    """Robot standing in a room with a few boxes, centimetre-level range noise only"""
+    angles = beam_angles(flip)
+    walls = [("x", 2.5), ("x", -2.0), ("y", 1.5), ("y", -1.8)]
+    base = cast(angles, walls=walls, circles=[(1.2, 0.4, 0.2), (-0.8, -1.0, 0.3), (0.5, -0.9, 0.05)])
+    return [Scan(base + rng.normal(0, 0.01, BEAMS), truth=base) for _ in range(n)]
+
+
+def moving_target(n, flip, rng):
+    """A person-sized object walking in front of the robot, for the tracking modes"""
+    angles = beam_angles(flip)
+    scans = []
+    for i in range(n):
+        phase = 2 * math.pi * i / n
+        target = (0.6 + 0.15 * math.sin(phase), 0.3 * math.sin(2 * phase), 0.12)
+        scans.append(Scan(cast(angles, walls=[("x", 3.0), ("y", 2.0), ("y", -2.0)], circles=[target])))
+    return scans
+
+
+SCENES = {
+    "corridor": corridor,
+    "cluttered_room": cluttered_room,
+    "noisy": noisy,
+    "standstill": standstill,
+    "moving_target": moving_target,
+}
+
+
+def load_capture(path):
+    """Scans recorded with --capture (.npz with ranges[scans, beams] and scan geometry)"""
+    data = np.load(path)
+    return [
+        Scan(ranges, float(data["angle_min"]), float(data["angle_increment"]),
+             float(data["range_min"]), float(data["range_max"]))
+        for ranges in data["ranges"]
+    ]
+
+
+def capture(path, count):
+    """Record count scans from the live /scan topic (run on the robot, with ROS)"""
+    import rospy
+    import sensor_msgs.msg as sensor_msg
+    from rospy.numpy_msg import numpy_msg
+
+    rospy.init_node("lidar_bench_capture", anonymous=True)
+    scans = []
+    for _ in range(count):
+        scans.append(rospy.wait_for_message("scan", numpy_msg(sensor_msg.LaserScan), timeout=5.0))
+    first = scans[0]
+    np.savez_compressed(
+        path,
+        ranges=np.stack([np.asarray(s.ranges, dtype=np.float32) for s in scans]),
+        angle_min=first.angle_min, angle_increment=first.angle_increment,
+        range_min=first.range_min, range_max=first.range_max,
+    )
+    print(f"Saved {len(scans)} scans to {path}")
+
+
+# --- Benchmark ---------------------------------------------------------------
+
+def make_controller():
+    import src.lidar_controller as lidar_controller
+
+    # Skip the KEY2 wait and stop the actuation thread so decisions stay in the
+    # mailbox; run_mode() actuates them itself
+    lidar_controller.LidarController.wait_for_key2_to_start = lambda self: None
+    node = lidar_controller.LidarController("lidar_bench")
+    node.actuation_stopped.set()
+    node.actuation_thread.join()
+    return node, lidar_controller
+
+
+def describe(command):
+    """Short, comparable label for a decision taken out of the mailbox"""
+    kind, payload = command
+    if kind == "twist":
+        return f"twist x={payload.linear.x:+.2f} z={payload.angular.z:+.2f}"
+    if kind == "cmd_vel":
+        return f"cmd_vel z={payload[2]:+.2f}"
+    if kind == "cruise":
+        return f"{kind} stride={payload['stride']:.0f} time={payload['time']:.2f}"
+    if isinstance(payload, dict):
+        return f"{kind} stride={payload['stride']:.0f} rot={payload['rotation']:+.2f}"
+    return kind
+
+
+def forward_speed(command, gait):
+    """Nominal forward speed (m/s) a decision asks for"""
+    kind, payload = command
+    if kind == "twist":
+        return max(payload.linear.x, 0.0)
+    if isinstance(payload, dict):
+        return gait.gait_speed(payload)
+    if kind in gait.GAITS:
+        return gait.gait_speed(gait.GAITS[kind])
+    return 0.0
+
+
+def actuate(node):
+    """Take the decision of the last scan and act on it like the actuation thread would"""
+    item = node.mailbox.take(timeout=0)
+    if item:
+        node.actuate(*item[0])
+    return item
+
+
+def run_mode(node, lidar_controller, mode, scans, independent):
+    node.reset_value()
+    node.set_running_srv_callback(_Msg(data=mode))
+    node.mailbox.clear()
+    node.gait_commander.reset()
+    node.walking = False
+
+    latencies = np.empty(len(scans))
+    decisions = collections.Counter()
+    speeds = np.zeros(len(scans))
+    near_collisions = 0
+    skipped = 0
+    for i, scan in enumerate(scans):
+        if independent:
+            node.turn.reset()  # Judge every scan on its own, not "still turning"
+        unchanged = node.scans_unchanged
+        start = time.perf_counter()
+        node.lidar_callback(scan)
+        latencies[i] = time.perf_counter() - start
+        item = actuate(node)
+        if item:
+            decisions[describe(item[0])] += 1
+            speeds[i] = forward_speed(item[0], lidar_controller.gait)
+        elif node.scans_unchanged != unchanged:
+            # Skipped as unchanged: the previous decision keeps running
+            decisions["unchanged"] += 1
+            skipped += 1
+            speeds[i] = speeds[i - 1] if i else 0.0
+        else:
+            decisions["-"] += 1
+        if speeds[i] > 0:
+            geometry = node.geometry.get(scan, node.lidar_type, node.threshold, node.scan_angle)
+            ahead = geometry.forward_clearance(scan.truth, scan.range_min, scan.range_max)
+            if speeds[i] > 0 and ahead is not None and ahead[0] < NEAR_COLLISION:
+                near_collisions += 1
+
+    # Second pass under tracemalloc for the transient allocation peak per scan
+    node.reset_value()
+    node.set_running_srv_callback(_Msg(data=mode))
+    node.mailbox.clear()
+    node.gait_commander.reset()
+    node.walking = False
+    tracemalloc.start()
+    peaks = []
+    for scan in scans:
+        if independent:
+            node.turn.reset()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        node.lidar_callback(scan)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        actuate(node)
+    tracemalloc.stop()
+
+    return {
+        "p50_us": float(np.percentile(latencies, 50) * 1e6),
+        "p99_us": float(np.percentile(latencies, 99) * 1e6),
+        "max_us": float(latencies.max() * 1e6),
+        "alloc_peak_kib": float(np.median(peaks) / 1024),
+        "speed_mm_s": float(speeds.mean() * 1000),
+        "near_collisions": near_collisions,
+        "skipped_pct": 100.0 * skipped / len(scans),
+        "decisions": dict(decisions.most_common()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenes", nargs="*", default=list(SCENES), choices=list(SCENES))
+    parser.add_argument("--scans", nargs="*", default=[], help="recorded .npz captures")
+    parser.add_argument("--count", type=int, default=300, help="scans per synthetic scene / to capture")
+    parser.add_argument("--modes", nargs="*", type=int, help="running modes (default: all)")
+    parser.add_argument("--lidar-type", default="YDLIDAR_G4")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a ~private ROS parameter, e.g. filter_type=0")
+    parser.add_argument("--stateful", action="store_true",
+                        help="keep turn state between scans (default judges each scan on its own)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--capture", metavar="NPZ", help="record scans from /scan instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.capture:
+        capture(args.capture, args.count)
+        return
+
+    params = {}
+    for item in args.param:
+        name, value = item.split("=", 1)
+        params[name] = json.loads(value)
+    os.environ["LIDAR_TYPE"] = args.lidar_type
+    install_stubs(params)
+    node, lidar_controller = make_controller()
+
+    rng = np.random.default_rng(args.seed)
+    flip = "RPLIDAR" in args.lidar_type
+    inputs = {name: SCENES[name](args.count, flip, rng) for name in args.scenes}
+    for path in args.scans:
+        inputs[os.path.basename(path)] = load_capture(path)
+
+    modes = args.modes if args.modes is not None else list(range(lidar_controller.MAX_RUNNING_MODE + 1))
+    results = {}
+    print(f"{'input':<18}{'mode':>5}{'p50 us':>10}{'p99 us':>10}{'alloc KiB':>11}{'mm/s':>7}{'near':>6}{'skip %':>8}  decisions")
+    for name, scans in inputs.items():
+        for mode in modes:
+            r = run_mode(node, lidar_controller, mode, scans, not args.stateful)
+            results[f"{name}/{mode}"] = r
+            top = ", ".join(f"{k}: {v}" for k, v in list(r["decisions"].items())[:3])
+            print(f"{name:<18}{mode:>5}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['alloc_peak_kib']:>11.1f}"
+                  f"{r['speed_mm_s']:>7.1f}{r['near_collisions']:>6}{r['skipped_pct']:>8.1f}  {top}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"lidar_type": args.lidar_type, "params": params, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
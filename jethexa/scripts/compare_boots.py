@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Compare boot timeline reports and flag phases that got slower
+
+main.py and lidar_controller.py write one report per boot to BOOT_REPORT_DIR
+(logs/boot/). Spans (startup steps, imports, phases) are compared on their
+duration, marks (avoidance_active) on how long after process start they
+happened, not counting the waits before them. Waits on a person or on the
+network (the KEY2 press, the first operator command, the WiFi) are left
+out. The baseline is the median over the previous --window boots. A phase
+regresses when it is both --threshold (relative) and --min-delta seconds
+slower than the baseline, or when it no longer ends "ok". The exit status
+is 1 if anything regressed.
+
+    python3 scripts/compare_boots.py                    # newest boot vs the ones before, per process
+    python3 scripts/compare_boots.py old.json new.json  # the last report vs the median of the others
+    python3 scripts/compare_boots.py --window 5 --threshold 0.2 --min-delta 0.3 --json diff.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from src.config import BOOT_REPORT_DIR
+from src.utils.timeline import MARK, WAIT, load_report
+
+
+def phase_values(report):
+    """{name: (kind, seconds, status)} of the comparable events of a report"""
+    waits = [(event['start'], event['end']) for event in report['events'] if event['kind'] == WAIT]
+    values = {}
+    for event in report['events']:
+        if event['kind'] == WAIT or event['name'] in values:
+            continue
+        if event['kind'] == MARK:
+            waited = sum(min(end, event['end']) - start for start, end in waits if start < event['end'])
+            seconds = event['end'] - waited
+        else:
+            seconds = event['end'] - event['start']
+        values[event['name']] = (event['kind'], seconds, event['status'])
+    return values
+
+
+def compare(baselines, current, threshold, min_delta):
+    """Rows of (name, kind, baseline s, current s, status, regressed) in current's order"""
+    history = [phase_values(report) for report in baselines]
+    rows = []
+    for name, (kind, seconds, status) in phase_values(current).items():
+        seen = [values[name][1] for values in history if name in values]
+        base = statistics.median(seen) if seen else None
+        was_ok = any(values[name][2] == "ok" for values in history if name in values)
+        regressed = (status != "ok" and was_ok) or (
+            base is not None and seconds - base >= min_delta and seconds > base * (1 + threshold))
+        rows.append((name, kind, base, seconds, status, regressed))
+    for name in sorted({name for values in history for name in values} - {row[0] for row in rows}):
+        rows.append((name, history[-1].get(name, ("?",))[0], None, None, "missing", False))
+    return rows
+
+
+def latest_reports(directory):
+    """{process: [report, ...]} oldest first"""
+    grouped = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            report = load_report(os.path.join(directory, filename))
+            grouped.setdefault(report['process'], []).append(report)
+    return grouped
+
+
+def print_rows(title, rows):
+    print(title)
+    print(f"  {'phase':<28}{'kind':<8}{'base s':>9}{'now s':>9}{'delta s':>9}  status")
+    for name, kind, base, seconds, status, regressed in rows:
+        fmt = lambda v: f"{v:9.3f}" if v is not None else f"{'-':>9}"
+        delta = seconds - base if base is not None and seconds is not None else None
+        flag = "  << REGRESSION" if regressed else ""
+        print(f"  {name:<28}{kind:<8}{fmt(base)}{fmt(seconds)}{fmt(delta)}  {status}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("reports", nargs="*", help="report files, oldest first (default: newest in --dir)")
+    parser.add_argument("--dir", default=BOOT_REPORT_DIR, help="report directory")
+    parser.add_argument("--window", type=int, default=5, help="previous boots in the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts")
+    parser.add_argument("--min-delta", type=float, default=0.5, help="absolute slowdown (s) that counts")
+    parser.add_argument("--json", help="also write the comparison to this file")
+    args = parser.parse_args()
+
+    if args.reports:
+        if len(args.reports) < 2:
+            parser.error("need at least two reports to compare")
+        reports = [load_report(path) for path in args.reports]
+        runs = {reports[-1]['process']: reports}
+    else:
+        if not os.path.isdir(args.dir):
+            parser.error(f"no reports in {args.dir}")
+        runs = latest_reports(args.dir)
+
+    results = {}
+    regressions = 0
+    for process, reports in runs.items():
+        if len(reports) < 2:
+            print(f"{process}: only one boot recorded, nothing to compare")
+            continue
+        current = reports[-1]
+        baselines = reports[-1 - args.window:-1]
+        rows = compare(baselines, current, args.threshold, args.min_delta)
+        print_rows(f"{process}: boot of {current['started_at']} vs median of {len(baselines)} before", rows)
+        regressions += sum(row[5] for row in rows)
+        results[process] = {
+            'current': current['started_at'],
+            'baselines': [report['started_at'] for report in baselines],
+            'phases': [dict(zip(("name", "kind", "baseline_s", "current_s", "status", "regressed"), row))
+                       for row in rows],
+        }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    print(f"{regressions} regression(s)")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Stand-in teleop client and LAN vs Firebase latency benchmark
+
+Sends stop commands (all zeros, so the robot stays put) with a seq and a
+timestamp at a fixed rate, and measures the round trip to the robot's ack for
+each seq: over the LAN command endpoint (signed UDP datagrams, acked straight
+after the command is published) and/or through Firebase (the same payload
+written to robot_commands/latest, acked under robot_commands/ack at a limited
+rate, so only some seqs get an ack).
+
+The LAN packets are signed with the key the robot publishes under
+sessions/<PIN>/lan in Firebase. It is read from there unless --key is given.
+
+    python3 scripts/lan_teleop_client.py --loopback              # no robot needed
+    python3 scripts/lan_teleop_client.py --host 192.168.1.20 --session 123456
+    python3 scripts/lan_teleop_client.py --host 192.168.1.20 --session 123456 --firebase
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from src.config import LAN_COMMAND_PORT, SERVICE_ACCOUNT_PATH, DATABASE_URL
+from src.utils.latency import LatencyHistogram
+from src.utils.web_server import CommandEndpoint, new_lan_key, sign_packet, verify_packet
+
+
+def stop_command(seq):
+    return {
+        'vx': 0.0, 'vy': 0.0, 'yaw': 0.0,
+        'walk_forward': False, 'walk_backward': False,
+        'strafe_left': False, 'strafe_right': False,
+        'turn_left': False, 'turn_right': False,
+        'emergency_stop': False,
+        'seq': seq,
+        'timestamp': int(time.time() * 1000),
+        'source': 'lan_teleop_client',
+    }
+
+
+def start_loopback_robot(key):
+    """Endpoint on localhost that acks every command at once"""
+    def on_command(payload, reply):
+        reply({'seq': payload['seq'], 'published_at': int(time.time() * 1000)})
+    server = CommandEndpoint(key, on_command, port=0, host="127.0.0.1")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address
+
+
+def init_firebase(service_account, database_url):
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.Certificate(service_account), {'databaseURL': database_url})
+
+
+def fetch_lan_key(session_code, service_account, database_url):
+    """Key the robot published for its LAN endpoint, None if there is none"""
+    from firebase_admin import db
+
+    init_firebase(service_account, database_url)
+    lan = db.reference(f'sessions/{session_code}/lan').get()
+    return lan.get('key') if isinstance(lan, dict) else None
+
+
+def run_lan(address, key, rate, count):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.2)
+    sent = {}
+    hist = LatencyHistogram()
+    done = threading.Event()
+
+    def receive():
+        while not done.is_set():
+            try:
+                packet, _ = sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            ack = verify_packet(key, packet)
+            if ack is not None and ack.get('seq') in sent:
+                hist.add(time.monotonic() - sent.pop(ack['seq']))
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+    for seq in range(1, count + 1):
+        sent[seq] = time.monotonic()
+        sock.sendto(sign_packet(key, stop_command(seq)), address)
+        time.sleep(1.0 / rate)
+    time.sleep(0.5)  # Late acks
+    done.set()
+    receiver.join()
+    return hist, len(sent)
+
+
+def run_firebase(session_code, rate, count, service_account, database_url):
+    from firebase_admin import db
+
+    init_firebase(service_account, database_url)
+    commands_ref = db.reference(f'sessions/{session_code}/robot_commands/latest')
+    ack_ref = db.reference(f'sessions/{session_code}/robot_commands/ack')
+    sent = {}
+    hist = LatencyHistogram()
+
+    def on_ack(event):
+        ack = event.data if isinstance(event.data, dict) else None
+        if ack and ack.get('seq') in sent:
+            hist.add(time.monotonic() - sent.pop(ack['seq']))
+
+    listener = ack_ref.listen(on_ack)
+    # Start above anything the robot has seen on this session
+    base = int(time.time())
+    for i in range(count):
+        seq = base + i
+        sent[seq] = time.monotonic()
+        commands_ref.set(stop_command(seq))
+        time.sleep(1.0 / rate)
+    time.sleep(2.0)  # Late acks
+    listener.close()
+    return hist, len(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="robot address on the LAN")
+    parser.add_argument("--port", type=int, default=LAN_COMMAND_PORT)
+    parser.add_argument("--session", default="000000", help="session code (the PIN on the OLED)")
+    parser.add_argument("--key", help="LAN key of the robot (default: read from the session in Firebase)")
+    parser.add_argument("--rate", type=float, default=10.0, help="commands per second")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--loopback", action="store_true",
+                        help="benchmark against an in-process endpoint instead of a robot")
+    parser.add_argument("--firebase", action="store_true", help="also measure the Firebase path")
+    parser.add_argument("--no-lan", action="store_true", help="skip the LAN measurement")
+    parser.add_argument("--service-account", default=SERVICE_ACCOUNT_PATH)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    if not args.no_lan:
+        if args.loopback:
+            key = args.key or new_lan_key()
+            address = start_loopback_robot(key)
+        else:
+            key = args.key or fetch_lan_key(args.session, args.service_account, args.database_url)
+            if not key:
+                parser.error(f"no LAN key published for session {args.session}, pass --key")
+            address = (args.host, args.port)
+        hist, lost = run_lan(address, key, args.rate, args.count)
+        results['lan'] = dict(hist.summary(), unacked=lost)
+    if args.firebase:
+        hist, lost = run_firebase(args.session, args.rate, args.count, args.service_account, args.database_url)
+        results['firebase'] = dict(hist.summary(), unacked=lost)
+
+    print(f"{'channel':10s} {'acks':>6s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'unacked':>8s}")
+    for channel, r in results.items():
+        if not r['count']:
+            print(f"{channel:10s} {0:6d} {'-':>9s} {'-':>9s} {'-':>9s} {'-':>9s} {r['unacked']:8d}")
+            continue
+        print(f"{channel:10s} {r['count']:6d} {r['p50_ms']:9.2f} {r['p90_ms']:9.2f} "
+              f"{r['p99_ms']:9.2f} {r['max_ms']:9.2f} {r['unacked']:8d}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
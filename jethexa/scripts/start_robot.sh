@@ -16,14 +16,7 @@ cd "$PROJECT_ROOT"
 
 echo "🚀 Starting Robot System from $PROJECT_ROOT"
 
-# Run main script
-python3 src/main.py &
-MAIN_PID=$!
-
-# Run lidar controller
-python3 src/lidar_controller.py &
-LIDAR_PID=$!
-
-# Wait for both processes
-wait $MAIN_PID
-wait $LIDAR_PID
+# Run main.py, command_mux.py (teleop and lidar publish into it, it drives
+# the controller) and lidar_controller.py under the launcher: it restarts a
+# node that dies and stops all of them on Ctrl+C / SIGTERM
+exec python3 src/launcher.py
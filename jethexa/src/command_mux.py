@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+import os
+import sys
+import time
+import threading
+import rospy
+import geometry_msgs.msg as geo_msg
+import std_msgs.msg as std_msg
+from jethexa_controller_interfaces.msg import Traveling
+from std_srvs.srv import Trigger, TriggerResponse
+
+# Add the parent directory to sys.path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import mux
+from src.utils.log import setup_logging, shutdown_logging, get_logger
+
+log = get_logger("mux")
+
+class Source:
+    """Latest commands of one mux input"""
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.hold = timeout  # Of the last message, see traveling_callback
+        self.last_msg = None
+        self.kind = None  # "twist" or "traveling", whichever came last
+        self.twist = None
+        self.traveling = None
+        self.traveling_new = False
+        self.engaged = False  # e-stop only
+        self.received = 0
+
+    def active(self, now):
+        if self.name == mux.ESTOP and not self.engaged:
+            return False
+        if self.last_msg is None:
+            return False
+        return self.hold <= 0 or now - self.last_msg <= self.hold
+
+
+class CommandMux:
+    """Arbitrates between command sources and drives the jethexa controller
+
+    Sources in priority order: e-stop, lidar safety, teleop, autonomy. Each
+    publishes Twist / Traveling messages under command_mux/<source>/ (see
+    utils/mux.py); the e-stop is a latched Bool on command_mux/estop. The
+    highest-priority source that is still within its timeout wins; a
+    stepped gait or a stop only holds on for its duration, and a source can
+    release control early on command_mux/<source>/release. Its Twist
+    is republished at a fixed rate, its Traveling messages are forwarded
+    once. On a change of control the running gait is stopped, and the new
+    winner's continuous gait (if any) is sent again. The source in control is
+    published latched on command_mux/active ("none" when idle).
+    """
+
+    def __init__(self, name):
+        rospy.init_node(name, anonymous=False)
+        self.name = name
+        self.rate = rospy.get_param("~rate", 20.0)
+        output_prefix = rospy.get_param("~output_prefix", "jethexa_controller")
+        self.lock = threading.Lock()
+        self.sources = [
+            Source(source, rospy.get_param("~timeouts/" + source, mux.DEFAULT_TIMEOUTS[source]))
+            for source in mux.SOURCES
+        ]
+        self.winner = None
+        self.gait_running = False
+        self.moving = False
+        self.switches = 0
+        self.forwarded = 0
+
+        self.cmd_vel_pub = rospy.Publisher(output_prefix + "/cmd_vel", geo_msg.Twist, queue_size=1)
+        self.traveling_pub = rospy.Publisher(output_prefix + "/traveling", Traveling, queue_size=1)
+        self.active_pub = rospy.Publisher(mux.ACTIVE_TOPIC, std_msg.String, queue_size=1, latch=True)
+        self.active_pub.publish(std_msg.String(data="none"))
+
+        for source in self.sources:
+            if source.name == mux.ESTOP:
+                rospy.Subscriber(mux.ESTOP_TOPIC, std_msg.Bool, self.estop_callback, source, queue_size=1)
+                continue
+            prefix = mux.source_prefix(source.name)
+            rospy.Subscriber(prefix + "/cmd_vel", geo_msg.Twist, self.twist_callback, source, queue_size=1)
+            rospy.Subscriber(prefix + "/traveling", Traveling, self.traveling_callback, source, queue_size=1)
+            rospy.Subscriber(prefix + "/release", std_msg.Empty, self.release_callback, source, queue_size=1)
+
+        self.stats_srv = rospy.Service(self.name + "/stats", Trigger, self.stats_srv_callback)
+
+    def twist_callback(self, msg, source):
+        with self.lock:
+            source.last_msg = time.monotonic()
+            source.kind = "twist"
+            source.hold = source.timeout
+            source.twist = msg
+            source.received += 1
+
+    def traveling_callback(self, msg, source):
+        with self.lock:
+            source.last_msg = time.monotonic()
+            source.kind = "traveling"
+            # A continuous gait is kept alive by its source; a stepped gait or
+            # a stop is done after steps * time
+            if msg.gait != 0 and msg.steps == 0:
+                source.hold = source.timeout
+            else:
+                duration = msg.steps * msg.time + mux.STEPPED_HOLD_MARGIN
+                source.hold = min(source.timeout, duration) if source.timeout > 0 else duration
+            source.traveling = msg
+            source.traveling_new = True
+            source.received += 1
+
+    def release_callback(self, msg, source):
+        with self.lock:
+            source.last_msg = None
+            source.traveling_new = False
+            source.received += 1
+
+    def estop_callback(self, msg, source):
+        with self.lock:
+            source.last_msg = time.monotonic()
+            source.engaged = bool(msg.data)
+            source.received += 1
+        log.warning("🛑 E-stop %s", "ENGAGED" if msg.data else "released")
+
+    def select(self, now):
+        for source in self.sources:
+            if source.active(now):
+                return source
+        return None
+
+    def stop_outputs(self):
+        if self.gait_running:
+            self.traveling_pub.publish(Traveling(gait=0))
+            self.gait_running = False
+        if self.moving:
+            self.cmd_vel_pub.publish(geo_msg.Twist())
+            self.moving = False
+
+    def tick(self):
+        now = time.monotonic()
+        with self.lock:
+            winner = self.select(now)
+            if winner is not self.winner:
+                previous = self.winner.name if self.winner else "none"
+                current = winner.name if winner else "none"
+                log.info("🔀 Control: %s -> %s", previous, current)
+                self.switches += 1
+                self.winner = winner
+                self.active_pub.publish(std_msg.String(data=current))
+                self.stop_outputs()
+                # A continuous gait keeps running on the controller, so the new
+                # winner's one is sent again after the stop above
+                if winner is not None and winner.kind == "traveling" and winner.traveling.steps == 0:
+                    winner.traveling_new = True
+
+            for source in self.sources:
+                if source is not winner:
+                    source.traveling_new = False  # Lost arbitration, never sent
+
+            if winner is None:
+                return
+            if winner.name == mux.ESTOP:
+                self.cmd_vel_pub.publish(geo_msg.Twist())
+                return
+            if winner.traveling_new:
+                winner.traveling_new = False
+                self.traveling_pub.publish(winner.traveling)
+                self.gait_running = winner.traveling.gait != 0
+                self.forwarded += 1
+            elif winner.kind == "twist":
+                self.cmd_vel_pub.publish(winner.twist)
+                twist = winner.twist
+                self.moving = bool(twist.linear.x or twist.linear.y or twist.angular.z)
+
+    def stats_srv_callback(self, msg):
+        with self.lock:
+            counts = ", ".join("{}: {}".format(s.name, s.received) for s in self.sources)
+            message = "active: {}, switches: {}, traveling forwarded: {}, received {}".format(
+                self.winner.name if self.winner else "none", self.switches, self.forwarded, counts)
+        return TriggerResponse(success=True, message=message)
+
+    def spin(self):
+        rate = rospy.Rate(self.rate)
+        while not rospy.is_shutdown():
+            try:
+                self.tick()
+            except Exception as e:
+                log.error("Mux error: %s", e, key='tick_error', every=1.0)
+            try:
+                rate.sleep()
+            except rospy.ROSInterruptException:
+                break
+        with self.lock:
+            self.stop_outputs()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    node = CommandMux("command_mux")
+    log.info("Command mux running: %s", " > ".join(mux.SOURCES))
+    try:
+        node.spin()
+    finally:
+        shutdown_logging()
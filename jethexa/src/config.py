@@ -12,4 +12,45 @@ SERVICE_ACCOUNT_PATH = os.path.join(BASE_DIR, "config", "service_account.json")
 DATABASE_URL = "YOUR_DATABASE_URL"
 HTML_FILENAME = "agora_v1.html"
 WEB_SERVER_PORT = 8000
+# UDP port of the LAN command endpoint. Commands are HMAC-signed with a random
+# key made on every run and published to operators under sessions/<PIN>/lan
+LAN_COMMAND_PORT = 8001
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+
+# Rate (Hz) at which teleop commands are published to ROS
+TELEOP_PUBLISH_RATE = 20
+
+# Teleop dead-man watchdog: stop ramp starts after this long without a command (s)
+TELEOP_STALE_TIMEOUT = 1.0
+# Time (s) over which the watchdog ramps velocity down to zero
+TELEOP_STOP_RAMP = 0.5
+# Max rate (Hz) at which command acks are written back to Firebase
+TELEOP_ACK_RATE = 5
+# Interval (s) between teleop status summaries in the log
+TELEOP_STATUS_INTERVAL = 5.0
+# LAN commands newer than this (s) take priority over Firebase
+LAN_COMMAND_TIMEOUT = 0.5
+# Collision governor: keep at least this many seconds to reach the stop
+# distance (m) from the nearest obstacle in the direction of travel (0 = off)
+TELEOP_COLLISION_TTC = 1.5
+TELEOP_STOP_DISTANCE = 0.35
+# Speed cap (m/s) while the governor has no recent scan (lidar not started or down)
+TELEOP_BLIND_SPEED = 0.03
+
+# Boot timeline reports of main.py / lidar_controller.py (newest BOOT_REPORT_KEEP
+# per process are kept), compared with scripts/compare_boots.py
+BOOT_REPORT_DIR = os.path.join(BASE_DIR, "logs", "boot")
+BOOT_REPORT_KEEP = 20
+
+# Last session from the registration Lambda, reused after a reboot while the
+# Lambda still reports it as waiting for VR with SESSION_MIN_REMAINING (s) left
+SESSION_CACHE_PATH = os.path.join(BASE_DIR, "config", "session_cache.json")
+SESSION_MIN_REMAINING = 300
+
+# Cloud HTTP client (src/utils/network.py): urllib3 retries per request, calls
+# to an endpoint pause for HTTP_BREAKER_RESET (s) after HTTP_BREAKER_FAILURES
+# failures in a row, and the connectivity probe backs off up to INTERNET_RETRY_MAX (s)
+HTTP_RETRIES = 2
+HTTP_BREAKER_FAILURES = 3
+HTTP_BREAKER_RESET = 30.0
+INTERNET_RETRY_MAX = 3.0
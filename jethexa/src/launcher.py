@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""Runs main.py, command_mux.py and lidar_controller.py under one Supervisor
+
+Each node's output is echoed with its name in front. A node that dies is
+restarted with backoff. main.py owns roscore, so when it restarts the mux
+and the lidar controller restart with it (the lidar controller then waits
+for KEY2 again). SIGINT / SIGTERM stops everything.
+"""
+import os
+import signal
+import sys
+import threading
+
+# Add the parent directory to sys.path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import BASE_DIR
+from src.utils.log import setup_logging, shutdown_logging, get_logger
+from src.utils.supervisor import Supervisor
+
+log = get_logger("launcher")
+
+NODES = (
+    ("main", "src/main.py"),
+    ("command_mux", "src/command_mux.py"),
+    ("lidar", "src/lidar_controller.py"),
+)
+
+
+def main():
+    # Unbuffered, so echoed lines show up as they are written
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    supervisor = Supervisor(status_interval=60.0)
+    for name, script in NODES:
+        requires = () if name == "main" else ("main",)
+        # main.py stops roscore / base.launch on SIGINT, give it time
+        supervisor.add(name, [sys.executable, script], requires=requires, cwd=BASE_DIR, env=env,
+                       echo=True, stop_timeout=15.0 if name == "main" else 5.0)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    log.info("🚀 Starting %s", ", ".join(name for name, _ in NODES))
+    for name, _ in NODES:
+        supervisor.start(name)
+    while not stop.wait(1.0):
+        pass
+    log.info("🛑 Stopping robot processes...")
+    supervisor.stop()
+    log.info("📋 %s", supervisor.summary())
+
+
+if __name__ == "__main__":
+    setup_logging()
+    try:
+        main()
+    finally:
+        shutdown_logging()
@@ -4,49 +4,137 @@ import os
 import sys
 import math
 import time
-import rospy
-import subprocess
 import signal
 import threading
+
+# Add the parent directory to sys.path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The boot timeline starts before the heavy imports so they are on it too
+from src.config import BOOT_REPORT_DIR, BOOT_REPORT_KEEP
+from src.utils.timeline import BootTimeline, IMPORT, WAIT
+timeline = BootTimeline("lidar", BOOT_REPORT_DIR, BOOT_REPORT_KEEP)
+timeline.preload("numpy", "rospy", "jethexa_sdk.pid", "jethexa_controller.client")
+
+import rospy
+from rospy.numpy_msg import numpy_msg
 import numpy as np
 from jethexa_app import Heart
 import jethexa_sdk.misc as misc
 import jethexa_sdk.pid as pid
 import geometry_msgs.msg as geo_msg
 import sensor_msgs.msg as sensor_msg
-import sensor_msgs.point_cloud2 as pc2
+import nav_msgs.msg as nav_msg
+import std_msgs.msg as std_msg
 from jethexa_controller import client
 from std_srvs.srv import Empty, Trigger, TriggerRequest, TriggerResponse
 from std_srvs.srv import SetBool, SetBoolRequest, SetBoolResponse
 from jethexa_controller_interfaces.srv import SetInt64, SetInt64Request, SetInt64Response
 from jethexa_controller_interfaces.srv import SetFloat64List, SetFloat64ListRequest, SetFloat64ListResponse
-from laser_geometry import LaserProjection
-import Jetson.GPIO as GPIO
+
+timeline.begin("import src", IMPORT)
+from src.utils import lidar_perception
+from src.utils.actuation import CommandMailbox
+from src.utils import gait
+from src.utils.vfh import VectorFieldHistogram
+from src.utils import scan_filter
+from src.utils.tracking import TargetTracker
+from src.utils.buttons import ButtonDispatcher, load_gpio
+from src.utils.log import setup_logging, shutdown_logging, get_logger
+from src.utils import mux
+from src.utils.supervisor import Supervisor
+timeline.end("import src")
+
+GPIO = load_gpio()
+log = get_logger("lidar")
 
 MAX_SCAN_ANGLE = 360
+MAX_RUNNING_MODE = 5
 KEY2_GPIO_PIN = 25  # KEY2 is on GPIO 25
 
 class LidarController:
     def __init__(self, name):
-        rospy.init_node(name, anonymous=False)
+        with timeline.phase("node_init"):
+            rospy.init_node(name, anonymous=False)
         self.name = name
         self.running_mode = 0
         self.threshold = 0.5
         self.scan_angle = math.radians(80)
         self.speed = 0.08
         self.last_act = 0
-        self.timestamp = 0
-        self.is_turning = False
+        self.turn = gait.TurnMonitor(rospy.get_param("~turn_settle", 0.2))
         self.pid_yaw = pid.PID(0.8, 0, 0.05)
         self.pid_dist = pid.PID(0.6, 0, 0.05)
+        self.tracker = TargetTracker(
+            gap=rospy.get_param("~track_gap", 0.1),
+            gate=rospy.get_param("~track_gate", 0.3),
+            max_missed=rospy.get_param("~track_max_missed", 5)
+        )
         self.lock = threading.RLock()
         self.lidar_sub = None
         self.jethexa = client.Client(self)
+        # Decisions go through command_mux.py: stepped avoidance turns as the
+        # lidar safety source, everything else as autonomy. With ~use_mux false
+        # both drive the controller directly.
+        self.use_mux = rospy.get_param("~use_mux", True)
+        if self.use_mux:
+            self.safety_out = mux.MuxInput(mux.LIDAR_SAFETY)
+            self.autonomy_out = mux.MuxInput(mux.AUTONOMY)
+        else:
+            self.safety_out = self.autonomy_out = self.jethexa
+        self.safety_held = False  # Our last gait went out as lidar safety
         self.lidar_type = ""
         self.start_scan = self.__empty
         self.stop_scan = self.__empty
-        self.laser_projection = LaserProjection()
-        self.lidar_launch = None  # Store roslaunch process
+        # Owns lidar.launch: restarted when it dies or scans stop arriving
+        # while we are subscribed for longer than ~scan_liveness seconds
+        self.supervisor = Supervisor()
+        self.scan_liveness = rospy.get_param("~scan_liveness", 3.0)
+        self.last_scan = None
+        self.geometry = lidar_perception.GeometryCache()
+        self.history = scan_filter.ScanHistory(
+            rospy.get_param("~filter_size", 3),
+            rospy.get_param("~filter_type", scan_filter.FILTER_MEDIAN),
+            rospy.get_param("~filter_k", 2)
+        )
+        # While standing, scans that barely differ from the last processed one
+        # are not processed again; nothing is while running_mode is 0
+        self.scan_changes = scan_filter.ScanChangeDetector(
+            tolerance=rospy.get_param("~change_tolerance", 0.05),
+            min_beams=rospy.get_param("~change_beams", 3),
+            max_age=rospy.get_param("~change_max_age", 1.0)
+        )
+        self.scans_idle = 0
+        self.scans_unchanged = 0
+        self.scans_processed = 0
+        self.vfh = VectorFieldHistogram(
+            bins=rospy.get_param("~vfh_bins", 72),
+            window=rospy.get_param("~vfh_window", 1.0),
+            threshold=rospy.get_param("~vfh_threshold", 0.05)
+        )
+        self.vfh_gain = rospy.get_param("~vfh_gain", 1.0)
+        self.vfh_max_rotation = rospy.get_param("~vfh_max_rotation", 0.6)
+        self.vfh_hist_pub = rospy.Publisher(self.name + "/vfh/histogram", std_msg.Float32MultiArray, queue_size=1)
+        self.vfh_heading_pub = rospy.Publisher(self.name + "/vfh/heading", std_msg.Float32, queue_size=1)
+        # Mode 5 walks at full speed while the corridor ahead is further than
+        # this many seconds away (at full speed) beyond the threshold
+        self.cruise_ttc = rospy.get_param("~cruise_ttc", 6.0)
+
+        # Scan callback -> actuation thread handoff. Continuous decisions older
+        # than max_command_age when the actuator gets to them are dropped, and so
+        # are scans that were already max_scan_age old when they reached us.
+        self.mailbox = CommandMailbox()
+        self.max_scan_age = rospy.get_param("~max_scan_age", 0.5)
+        self.max_command_age = rospy.get_param("~max_command_age", 0.5)
+        self.scans_dropped = 0
+        self.commands_stale = 0
+        self.actuation_stopped = threading.Event()
+        # Only touched from the actuation thread, which publishes whether a gait
+        # is running in self.walking (a plain bool, read by the scan thread)
+        self.gait_commander = gait.GaitCommander(self.send_traveling, self.gait_keepalive())
+        self.walking = False
+        self.actuation_thread = threading.Thread(target=self.actuation_loop, daemon=True)
+        self.actuation_thread.start()
 
         # Auto-detect or set lidar type
         if "LIDAR_TYPE" in os.environ:
@@ -55,6 +143,7 @@ class LidarController:
             rospy.loginfo("No LIDAR_TYPE set, using RPLIDAR behavior for EAI G4")
             self.lidar_type = "RPLIDAR"
 
+        timeline.begin("lidar_services")
         if "YDLIDAR" in self.lidar_type:
             try:
                 rospy.wait_for_service("/stop_scan", timeout=5)
@@ -77,11 +166,21 @@ class LidarController:
                 rospy.logwarn("RPLIDAR/EAI motor services not available, continuing anyway")
         else:
             rospy.logwarn("Unknown LIDAR type, continuing without motor control")
+        timeline.end("lidar_services", lidar_type=self.lidar_type)
 
         self.enter_srv = rospy.Service(self.name + "/enter", Trigger, self.enter_srv_callback)
         self.exit_srv = rospy.Service(self.name + "/exit", Trigger, self.exit_srv_callback)
         self.set_running_srv = rospy.Service(self.name + "/set_running", SetInt64, self.set_running_srv_callback)
         self.set_parameters_srv = rospy.Service(self.name + "/set_parameters", SetFloat64List, self.set_parameters_srv_callback)
+        self.stats_srv = rospy.Service(self.name + "/stats", Trigger, self.stats_srv_callback)
+
+        # Yaw rate feedback lets a turn end as soon as the robot stops rotating;
+        # without it the turn ends after its gait duration
+        odom_topic = rospy.get_param("~odom_topic", "odom")
+        self.odom_sub = None
+        if odom_topic:
+            self.odom_sub = rospy.Subscriber(odom_topic, nav_msg.Odometry, self.odom_callback, queue_size=1)
+
         self.heart = Heart(self.name + "/heartbeat", 5, lambda _: self.exit_srv_callback(None))
         
         # Setup KEY2 button on GPIO 25
@@ -99,11 +198,28 @@ class LidarController:
     def __empty(self):
         pass
 
+    def gait_keepalive(self):
+        """~gait_keepalive, kept below the mux autonomy timeout
+
+        The mux hands control away from a source that has been quiet for its
+        timeout, so a gait resent less often (or never, <= 0) would be stopped
+        by the mux while we still think the robot is walking.
+        """
+        keepalive = rospy.get_param("~gait_keepalive", 2.0)
+        if not self.use_mux:
+            return keepalive
+        timeout = mux.source_timeout(mux.AUTONOMY)
+        if timeout > 0 and not 0 < keepalive < timeout:
+            rospy.logwarn("~gait_keepalive {} does not fit the mux autonomy timeout of {} s, using {}".format(
+                keepalive, timeout, 0.8 * timeout))
+            keepalive = 0.8 * timeout
+        return keepalive
+
     def setup_key2_button(self):
-        """Setup KEY2 button for toggling obstacle avoidance"""
+        """Setup edge-triggered KEY2 handling for start and toggling obstacle avoidance"""
+        self.key2 = ButtonDispatcher(GPIO, KEY2_GPIO_PIN)
         try:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setup(KEY2_GPIO_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            self.key2.start()
             rospy.loginfo(f"KEY2 button configured on GPIO {KEY2_GPIO_PIN}")
         except Exception as e:
             rospy.logerr(f"Failed to setup KEY2: {e}")
@@ -111,49 +227,23 @@ class LidarController:
     def wait_for_key2_to_start(self):
         """Wait for KEY2 press before starting the system"""
         rospy.loginfo("Waiting for KEY2 press...")
+        timeline.save()
         
-        # Wait for button press
-        previous_state = GPIO.input(KEY2_GPIO_PIN)
+        # Wake up now and then so Ctrl+C / rospy shutdown is noticed
+        timeline.begin("key2_wait", WAIT)
         while not rospy.is_shutdown():
-            current_state = GPIO.input(KEY2_GPIO_PIN)
-            
-            # Detect button press (HIGH to LOW transition)
-            if previous_state == 1 and current_state == 0:
+            if self.key2.wait_for_press(timeout=0.5):
                 rospy.loginfo("KEY2 pressed! Starting system...")
-                time.sleep(0.3)  # Debounce
                 break
-            
-            previous_state = current_state
-            time.sleep(0.05)
+        timeline.end("key2_wait")
         
         # Now start the system
         self.auto_start_system()
         
-        # Start button monitoring thread for toggling
-        self.key2_thread = threading.Thread(target=self.monitor_key2, daemon=True)
-        self.key2_thread.start()
+        # From now on every press toggles obstacle avoidance
+        self.key2.subscribe(self.toggle_obstacle_avoidance)
         rospy.loginfo("KEY2 monitoring started - Press KEY2 to toggle obstacle avoidance")
 
-    def monitor_key2(self):
-        """Monitor KEY2 button presses"""
-        previous_state = GPIO.input(KEY2_GPIO_PIN)
-        
-        while not rospy.is_shutdown():
-            try:
-                current_state = GPIO.input(KEY2_GPIO_PIN)
-                
-                # Detect button press (HIGH to LOW transition)
-                if previous_state == 1 and current_state == 0:
-                    self.toggle_obstacle_avoidance()
-                    time.sleep(0.3)  # Debounce delay
-                
-                previous_state = current_state
-                time.sleep(0.05)  # Poll every 50ms
-                
-            except Exception as e:
-                rospy.logerr(f"KEY2 monitoring error: {e}")
-                break
-
     def toggle_obstacle_avoidance(self):
         """Toggle obstacle avoidance on/off when KEY2 is pressed"""
         with self.lock:
@@ -162,7 +252,7 @@ class LidarController:
                 rospy.loginfo("KEY2 PRESSED - STOPPING OBSTACLE AVOIDANCE")
                 rospy.loginfo("="*60)
                 self.running_mode = 0
-                self.jethexa.traveling(gait=0)  # Stop robot
+                self.post_command(gait.STOP)  # Stop robot
                 rospy.loginfo("Robot stopped. Press KEY2 again to resume.")
             else:  # Currently OFF - turn ON
                 rospy.loginfo("="*60)
@@ -172,17 +262,14 @@ class LidarController:
                 rospy.loginfo("Obstacle avoidance active!")
 
     def launch_lidar_driver(self):
-        """Launch the lidar driver using subprocess"""
+        """Launch the lidar driver under the supervisor"""
         try:
             rospy.loginfo("Launching lidar driver...")
             
-            # Launch using subprocess
-            self.lidar_launch = subprocess.Popen(
-                ['roslaunch', 'jethexa_peripherals', 'lidar.launch'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                preexec_fn=os.setsid  # Create new process group for clean shutdown
-            )
+            if "lidar_driver" not in self.supervisor.processes:
+                self.supervisor.add("lidar_driver", ['roslaunch', 'jethexa_peripherals', 'lidar.launch'],
+                                    probe=self.scans_arriving, grace=15.0)
+            self.supervisor.start("lidar_driver")
             
             rospy.loginfo("Lidar driver launched successfully!")
             return True
@@ -190,21 +277,33 @@ class LidarController:
             rospy.logerr(f"Failed to launch lidar driver: {e}")
             return False
 
+    def scans_arriving(self):
+        """Liveness probe of the lidar driver"""
+        if self.lidar_sub is None:
+            return True  # Not listening (or the scan was stopped on purpose)
+        return self.last_scan is not None and time.monotonic() - self.last_scan < self.scan_liveness
+
     def auto_start_system(self):
         """Automatically start lidar and obstacle avoidance mode"""
         try:
             # Always launch the lidar driver
             rospy.loginfo("Launching lidar driver...")
-            if not self.launch_lidar_driver():
+            with timeline.phase("lidar_driver"):
+                launched = self.launch_lidar_driver()
+            if not launched:
                 rospy.logerr("Failed to start lidar driver!")
                 return
             
             # Wait for lidar data
             rospy.loginfo("Waiting for lidar data...")
+            timeline.begin("first_scan")
             try:
                 rospy.wait_for_message('/scan', sensor_msg.LaserScan, timeout=10.0)
+                timeline.end("first_scan")
                 rospy.loginfo("Lidar data detected!")
             except rospy.ROSException:
+                timeline.end("first_scan", status="timeout")
+                timeline.save()
                 rospy.logerr("ERROR: No lidar data after 10 seconds!")
                 rospy.logerr("Please check lidar connection and LIDAR_TYPE configuration.")
                 return
@@ -220,6 +319,8 @@ class LidarController:
             req = SetInt64Request()
             req.data = 1
             self.set_running_srv_callback(req)
+            timeline.mark("avoidance_active")
+            timeline.save()
             
             rospy.loginfo("="*60)
             rospy.loginfo("OBSTACLE AVOIDANCE ACTIVE!")
@@ -239,6 +340,7 @@ class LidarController:
         
         # Cleanup GPIO
         try:
+            self.key2.stop()
             GPIO.cleanup()
             rospy.loginfo("GPIO cleaned up!")
         except Exception as e:
@@ -248,7 +350,15 @@ class LidarController:
         try:
             with self.lock:
                 self.running_mode = 0  # Disable obstacle avoidance
-            self.jethexa.traveling(gait=0)  # Stop walking
+                self.actuation_stopped.set()  # No more queued commands after this
+                self.mailbox.clear()
+            # A command the actuation thread is already sending must not land
+            # after the stop below
+            if self.actuation_thread is not threading.current_thread():
+                self.actuation_thread.join(timeout=2.0)
+                if self.actuation_thread.is_alive():
+                    rospy.logwarn("Actuation thread still busy, stopping anyway")
+            self.send_traveling(**gait.GAITS[gait.STOP])  # Stop walking
             rospy.loginfo("Robot stopped!")
             rospy.sleep(0.5)
         except Exception as e:
@@ -262,16 +372,15 @@ class LidarController:
             rospy.logerr(f"Error stopping lidar scan: {e}")
         
         # Shutdown lidar driver if we launched it
-        if self.lidar_launch is not None:
+        if self.supervisor.processes:
             try:
                 rospy.loginfo("Stopping lidar driver...")
-                # Kill the entire process group
-                os.killpg(os.getpgid(self.lidar_launch.pid), signal.SIGTERM)
-                self.lidar_launch.wait(timeout=3)
+                self.supervisor.stop()  # Takes down its whole process group
                 rospy.loginfo("Lidar driver stopped!")
             except Exception as e:
                 rospy.logerr(f"Error stopping lidar driver: {e}")
         
+        rospy.loginfo(self.format_stats())
         rospy.loginfo("Shutdown complete!")
 
     def reset_value(self):
@@ -279,14 +388,17 @@ class LidarController:
         self.threshold = 0.5
         self.speed = 0.08
         self.last_act = 0
-        self.timestamp = 0
-        self.is_turning = False
+        self.turn.reset()
+        self.history.reset()
+        self.scan_changes.invalidate()
         self.scan_angle = math.radians(80)
         self.pid_yaw.clear()
         self.pid_dist.clear()
+        self.tracker.reset()
         try:
             if self.lidar_sub is not None:
                 self.lidar_sub.unregister()
+                self.lidar_sub = None
         except Exception as e:
             rospy.logerr(str(e))
 
@@ -294,141 +406,304 @@ class LidarController:
         rospy.loginfo("lidar enter")
         self.reset_value()
         self.start_scan()
-        self.lidar_sub = rospy.Subscriber('scan', sensor_msg.LaserScan, self.lidar_callback) 
+        # queue_size=1: a late scan is worth less than the next one.
+        # numpy_msg gives us ranges as an array instead of a tuple of floats
+        self.lidar_sub = rospy.Subscriber('scan', numpy_msg(sensor_msg.LaserScan), self.lidar_callback, queue_size=1)
         return TriggerResponse(success=True)
     
     def exit_srv_callback(self, _):
         rospy.loginfo('lidar exit')
         self.stop_scan()
-        self.reset_value()
-        self.jethexa.traveling(gait=0)
+        with self.lock:
+            self.reset_value()
+            self.post_command(gait.STOP)
         return TriggerResponse(success=True)
 
     def set_running_srv_callback(self, req: SetInt64Request):
         rsp = SetInt64Response(success=True)
         new_running_mode = req.data
         rospy.loginfo("set_running " + str(new_running_mode))
-        if not 0 <= new_running_mode <= 3:
+        if not 0 <= new_running_mode <= MAX_RUNNING_MODE:
             rsp.success = False
             rsp.message = "Invalid running mode {}".format(new_running_mode)
         else:
             with self.lock:
+                if new_running_mode != self.running_mode:
+                    self.tracker.reset()
+                    # Mode 0 buffers nothing, and the new mode decides afresh
+                    self.history.reset()
+                    self.scan_changes.invalidate()
                 self.running_mode = new_running_mode
                 if self.running_mode == 0:
-                    self.jethexa.traveling(gait=0)
+                    self.post_command(gait.STOP)
         return rsp
 
     def set_parameters_srv_callback(self, req: SetFloat64ListRequest):
+        """[threshold, scan_angle, speed] or [threshold, scan_angle, speed, filter_size, filter_type, filter_k]"""
         rsp = SetFloat64ListResponse(success=True)
         new_parameters = req.data
-        new_threshold, new_scan_angle, new_speed = new_parameters
+        if len(new_parameters) not in (3, 6):
+            rsp.success = False
+            rsp.message = "Expected 3 or 6 parameters, got {}".format(len(new_parameters))
+            return rsp
+        new_threshold, new_scan_angle, new_speed = new_parameters[:3]
         rospy.loginfo("n_t:{:2f}, n_a:{:2f}, n_s:{:2f}".format(new_threshold, new_scan_angle, new_speed))
         if not 0.3 <= new_threshold <= 1.5:
             rsp.success = False
             rsp.message = "New threshold ({:.2f}) is out of range (0.3 ~ 1.5)".format(new_threshold)
             return rsp
+        if not 0 < new_scan_angle <= MAX_SCAN_ANGLE:
+            rsp.success = False
+            rsp.message = "New scan angle ({:.2f}) is out of range (0 ~ {})".format(new_scan_angle, MAX_SCAN_ANGLE)
+            return rsp
         if not new_speed > 0:
             rsp.success = False
             rsp.message = "Invalid speed"
             return rsp
 
+        new_filter = None
+        if len(new_parameters) == 6:
+            new_filter = tuple(int(v) for v in new_parameters[3:])
+            filter_size, filter_type, filter_k = new_filter
+            rospy.loginfo("n_fs:{}, n_ft:{}, n_fk:{}".format(filter_size, filter_type, filter_k))
+            if not 1 <= filter_size <= scan_filter.MAX_HISTORY:
+                rsp.success = False
+                rsp.message = "New filter size ({}) is out of range (1 ~ {})".format(filter_size, scan_filter.MAX_HISTORY)
+                return rsp
+            if filter_type not in (scan_filter.FILTER_NONE, scan_filter.FILTER_MEDIAN, scan_filter.FILTER_MIN_OF_K):
+                rsp.success = False
+                rsp.message = "Invalid filter type {}".format(filter_type)
+                return rsp
+            if filter_type == scan_filter.FILTER_MIN_OF_K and not 1 <= filter_k <= filter_size:
+                rsp.success = False
+                rsp.message = "New filter k ({}) is out of range (1 ~ {})".format(filter_k, filter_size)
+                return rsp
+
         with self.lock:
             self.threshold = new_threshold
+            self.scan_angle = math.radians(new_scan_angle)
             self.speed = new_speed
+            if new_filter is not None:
+                self.history.configure(*new_filter)
+            self.scan_changes.invalidate()
         
         return rsp
+
+    def stats_srv_callback(self, _):
+        return TriggerResponse(success=True, message=self.format_stats())
+
+    def format_stats(self):
+        return ("scans idle: {}, unchanged: {}, processed: {}, "
+                "scans dropped: {}, commands posted: {}, superseded: {}, stale: {}, "
+                "gait sent: {}, suppressed: {}, targets acquired: {}, lost: {}, "
+                "log lines rate-limited: {}, {}").format(
+            self.scans_idle, self.scans_unchanged, self.scans_processed,
+            self.scans_dropped, self.mailbox.posted, self.mailbox.superseded, self.commands_stale,
+            self.gait_commander.sent, self.gait_commander.suppressed,
+            self.tracker.acquired, self.tracker.lost,
+            sum(suppressed for _, suppressed in log.counts.values()),
+            self.supervisor.summary() or "lidar driver not launched")
+
+    def post_command(self, kind, payload=None):
+        """Hand a decision to the actuation thread (never blocks)"""
+        self.mailbox.put((kind, payload))
+
+    def actuation_loop(self):
+        """Send the latest decision to the controller, outside of self.lock"""
+        while not rospy.is_shutdown() and not self.actuation_stopped.is_set():
+            item = self.mailbox.take(timeout=0.5)
+            if self.actuation_stopped.is_set():
+                continue
+            if item is None:
+                try:
+                    self.gait_commander.refresh()
+                except Exception as e:
+                    log.error("Gait keep-alive error: %s", e, key='keepalive_error', every=5.0)
+                continue
+            (kind, payload), stamp = item
+            # Continuous commands are re-posted every scan, so an old one is safe to
+            # skip. Turns and stops are one-shot and always go out.
+            if kind in (gait.FORWARD, gait.STEER, gait.CRUISE, "twist", "cmd_vel") and time.monotonic() - stamp > self.max_command_age:
+                self.commands_stale += 1
+                continue
+            try:
+                self.actuate(kind, payload)
+            except Exception as e:
+                log.error("Actuation error (%s): %s", kind, e, key='actuation_error', every=1.0)
+
+    def send_traveling(self, **params):
+        """A stepped gait is an avoidance manoeuvre that has to finish: lidar safety
+
+        Continuous gaits are autonomy. A stop goes out on both, so it wins
+        right away and autonomy's last gait is a stop too. The mux holds a
+        turn for its duration; once we move on (the turn may have ended early
+        on odometry) safety is released so autonomy gets control back.
+        """
+        if params.get("gait", 0) == 0:
+            self.autonomy_out.traveling(**params)
+            if self.safety_out is not self.autonomy_out:
+                self.safety_out.traveling(**params)
+            self.safety_held = self.safety_out is not self.autonomy_out
+        elif params.get("steps", 0) > 0:
+            self.safety_out.traveling(**params)
+            self.safety_held = self.safety_out is not self.autonomy_out
+        else:
+            # The mux resends autonomy's continuous gait when control comes
+            # back, so it does not matter which of the two arrives first
+            self.autonomy_out.traveling(**params)
+            self.release_safety()
+
+    def release_safety(self):
+        if self.safety_held:
+            self.safety_out.release()
+            self.safety_held = False
+
+    def actuate(self, kind, payload):
+        if kind in gait.GAITS:  # forward / turn_left / turn_right / stop
+            if kind == gait.TURN_LEFT:
+                log.info("Turning LEFT to avoid obstacle")
+            elif kind == gait.TURN_RIGHT:
+                log.info("Turning RIGHT to avoid obstacle")
+            self.gait_commander.request(kind)
+        elif kind in (gait.STEER, gait.CRUISE):
+            self.gait_commander.request(kind, payload)
+        elif kind == "twist":
+            self.gait_commander.reset()
+            self.release_safety()
+            self.autonomy_out.cmd_vel_pub.publish(payload)
+        elif kind == "cmd_vel":
+            self.gait_commander.reset()
+            self.release_safety()
+            self.autonomy_out.cmd_vel(*payload)
+        self.walking = self.gait_commander.current not in (None, gait.STOP)
     
-    def move_forward(self):
-        """Make robot walk forward using traveling gait"""
-        self.jethexa.traveling(
-            gait=1,           # RIPPER gait
-            stride=40.0,      # stride 40mm
-            height=15.0,      # step height 15mm
-            direction=0,      # forward
-            rotation=0.0,     # no rotation
-            time=1,           # time per step
-            steps=0,          # continuous walking
-            interrupt=True,
-            relative_height=False
-        )
+    def avoid(self, obstacle, now):
+        """Obstacle avoidance decision for the nearest obstacle (None if the path is clear)"""
+        if obstacle is not None:  # OBSTACLE DETECTED
+            min_x, min_y = obstacle
+            log.info("Obstacle at x=%.2fm, y=%.2fm", min_x, min_y, key='obstacle', every=0.5)
 
-    def turn_left(self):
-        """Turn left to avoid obstacle"""
-        rospy.loginfo("Turning LEFT to avoid obstacle")
-        self.is_turning = True
-        self.jethexa.traveling(
-            gait=1,
-            stride=30.0,
-            height=15.0,
-            direction=0,
-            rotation=0.6,     # positive rotation = left turn
-            time=0.8,
-            steps=4,          # turn for 4 steps
-            interrupt=True,
-            relative_height=False
-        )
+            if min_y >= 0:  # Obstacle on LEFT side - turn RIGHT
+                motion = gait.TURN_RIGHT
+            else:  # Obstacle on RIGHT side - turn LEFT
+                motion = gait.TURN_LEFT
+            self.post_command(motion)
 
-    def turn_right(self):
-        """Turn right to avoid obstacle"""
-        rospy.loginfo("Turning RIGHT to avoid obstacle")
-        self.is_turning = True
-        self.jethexa.traveling(
-            gait=1,
-            stride=30.0,
-            height=15.0,
-            direction=0,
-            rotation=-0.6,    # negative rotation = right turn
-            time=0.8,
-            steps=4,          # turn for 4 steps
-            interrupt=True,
-            relative_height=False
-        )
+            # Ignore decisions until the turn has finished
+            self.turn.start(gait.GAITS[motion], now)
+
+        else:  # NO OBSTACLE - MOVE FORWARD
+            log.info("Path clear - moving forward", key='path_clear', every=2.0)
+            self.post_command(gait.FORWARD)
+
+    def steer(self, hist, heading):
+        """VFH decision: walk with a rotation proportional to the chosen heading"""
+        if heading is None:
+            # Boxed in: rotate on the spot towards the emptier half
+            half = self.vfh.bins // 2
+            rotation = self.vfh_max_rotation if hist[half:].sum() < hist[:half].sum() else -self.vfh_max_rotation
+            stride = 0.0
+        else:
+            rotation = misc.set_range(self.vfh_gain * heading, -self.vfh_max_rotation, self.vfh_max_rotation)
+            # Slow down for sharp headings, turn on the spot beyond 90 degrees
+            stride = round(gait.GAITS[gait.FORWARD]["stride"] * max(0.0, math.cos(heading)))
+        # Quantised so small heading jitter doesn't count as a new command
+        self.post_command(gait.STEER, gait.steer_params(float(stride), round(rotation, 2)))
+
+    def cruise(self, obstacle, now):
+        """TTC decision: the sooner the corridor ahead would be reached, the slower the gait
+
+        Only when the nearest return is within threshold does it turn away,
+        exactly like mode 1.
+        """
+        clearance = math.inf if obstacle is None else obstacle[0] - self.threshold
+        if clearance <= 0:
+            self.avoid(obstacle, now)
+            return
+        ttc = clearance / gait.gait_speed(gait.cruise_params(1.0))
+        self.post_command(gait.CRUISE, gait.cruise_params(ttc / self.cruise_ttc))
+
+    def publish_vfh(self, hist, heading):
+        if self.vfh_hist_pub.get_num_connections() > 0:
+            self.vfh_hist_pub.publish(std_msg.Float32MultiArray(data=hist.tolist()))
+        if self.vfh_heading_pub.get_num_connections() > 0:
+            self.vfh_heading_pub.publish(std_msg.Float32(data=math.nan if heading is None else heading))
+
+    def track_target(self, x, y):
+        """Distance and bearing of the filtered target; (inf, 0) when there is none
+
+        With no target both PID loops fall into their "out of range" branch and
+        the robot stands still until something is acquired again.
+        """
+        target = self.tracker.update(x, y, time.monotonic(), self.threshold)
+        if target is None:
+            return math.inf, 0.0
+        point_x, point_y = target
+        return math.hypot(point_x, point_y), math.atan2(point_y, point_x)
+
+    def odom_callback(self, odom: nav_msg.Odometry):
+        with self.lock:
+            if self.running_mode not in (1, 5) or not self.turn.active:
+                return
+            now = time.monotonic()
+            if self.turn.update_yaw_rate(odom.twist.twist.angular.z, now) and self.turn.observed:
+                # Turn ended early: act on what the scans during the turn saw
+                if self.running_mode == 1:
+                    self.avoid(self.turn.obstacle, now)
+                else:
+                    self.cruise(self.turn.obstacle, now)
 
     def lidar_callback(self, lidar_data: sensor_msg.LaserScan):
-        cloud = self.laser_projection.projectLaser(lidar_data)
-        points = np.array(list(pc2.read_points(cloud, skip_nans=True)), dtype=np.float32)
+        self.last_scan = time.monotonic()
+        if self.running_mode == 0:
+            self.scans_idle += 1
+            return
+
+        # Drop scans that sat in a backlog; the next one is already on its way
+        stamp = lidar_data.header.stamp
+        if not stamp.is_zero() and (rospy.Time.now() - stamp).to_sec() > self.max_scan_age:
+            self.scans_dropped += 1
+            return
 
-        # Rotate for RPLIDAR/EAI G4
-        if "RPLIDAR" in self.lidar_type:
-            points = points * [-1.0, -1.0, 1.0, 1.0, 1.0] 
+        vfh_debug = None
 
         with self.lock:
+            # A running turn is judged on every scan so it ends on time, and
+            # so is every scan while a gait is running: the world may move
+            # less than the change tolerance per scan, but it keeps moving
+            turning = self.running_mode in (1, 5) and self.turn.active
+            if self.walking:
+                self.scan_changes.invalidate()
+            elif not turning and not self.scan_changes.changed(
+                    lidar_data.ranges, lidar_data.range_min, lidar_data.range_max, time.monotonic()):
+                self.scans_unchanged += 1
+                return
+            self.scans_processed += 1
+
+            # Temporal filter over the last few scans, or the raw scan
+            if self.history.enabled:
+                ranges = self.history.push(lidar_data.ranges, lidar_data.range_min, lidar_data.range_max)
+            else:
+                ranges = np.asarray(lidar_data.ranges, dtype=np.float64)
+            geometry = self.geometry.get(lidar_data, self.lidar_type, self.threshold, self.scan_angle)
+
             # OBSTACLE AVOIDANCE MODE
             if self.running_mode == 1:
-                # Check if we're still in a turning cooldown period
-                if time.time() < self.timestamp:
-                    return  # Skip this callback, still turning
-                
-                # Filter points in front of robot
-                points = filter(lambda p: abs(p[1]) < 0.3, points)
-                points = filter(lambda p: p[0] <= self.threshold, points)
-                points = filter(lambda p: abs(math.atan2(p[1], p[0])) < self.scan_angle / 2, points)
-                points = list(points)
-                
-                if len(points) > 0:  # OBSTACLE DETECTED
-                    min_x, min_y, min_z, _, _ = min(points, key=lambda p: p[0])
-                    rospy.loginfo(f"Obstacle at x={min_x:.2f}m, y={min_y:.2f}m")
-                    
-                    if min_y >= 0:  # Obstacle on LEFT side - turn RIGHT
-                        self.turn_right()
-                    else:  # Obstacle on RIGHT side - turn LEFT
-                        self.turn_left()
-                    
-                    # Wait for turn to complete
-                    self.timestamp = time.time() + 3.5
-                    
-                else:  # NO OBSTACLE - MOVE FORWARD
-                    self.is_turning = False
-                    rospy.loginfo("Path clear - moving forward")
-                    self.move_forward()
+                # Nearest point in the corridor in front of robot
+                obstacle = geometry.find_obstacle(ranges, lidar_data.range_min, lidar_data.range_max)
+
+                now = time.monotonic()
+                if not self.turn.finished(now):
+                    self.turn.observe(obstacle)  # Still turning, keep the estimate fresh
+                    return
+
+                self.avoid(obstacle, now)
 
             # TRACKING MODE
             elif self.running_mode == 2:
-                points = list(filter(lambda p: p[0] > 0.04, points))
-                points = map(lambda p: (p[0], p[1], math.sqrt(p[0] * p[0] + p[1] * p[1])), points) 
-                points = filter(lambda p: p[2] > 0.25, points)
-                point_x, point_y, dist = min(points, key=lambda p: p[2])
-                angle = math.atan2(point_y, point_x)
+                x, y = geometry.project(ranges, lidar_data.range_min, lidar_data.range_max)
+                x, y = lidar_perception.track_points(x, y, min_x=lidar_perception.TRACK_MIN_X)
+                dist, angle = self.track_target(x, y)
 
                 twist = geo_msg.Twist()
                 if dist < self.threshold and abs(0.35 - dist) > 0.04:
@@ -445,14 +720,13 @@ class LidarController:
                         twist.linear.x = misc.set_range(self.pid_dist.output, -self.speed * 6, self.speed * 6)
                 else:
                     self.pid_yaw.clear()
-                self.jethexa.cmd_vel_pub.publish(twist)
+                self.post_command("twist", twist)
 
             # TRACKING ROTATION MODE
             elif self.running_mode == 3:
-                points = map(lambda p: (p[0], p[1], math.sqrt(p[0] * p[0] + p[1] * p[1])), points)
-                points = filter(lambda p: p[2] > 0.25, points)
-                point_x, point_y, dist = min(points, key=lambda p: p[2])
-                angle = math.atan2(point_y, point_x)
+                x, y = geometry.project(ranges, lidar_data.range_min, lidar_data.range_max)
+                x, y = lidar_perception.track_points(x, y)
+                dist, angle = self.track_target(x, y)
 
                 if dist < self.threshold and abs(math.degrees(angle)) > 5:
                     self.pid_yaw.update(-angle)
@@ -460,10 +734,32 @@ class LidarController:
                 else:
                     z = 0
                     self.pid_yaw.clear()
-                self.jethexa.cmd_vel(0, 0, z)
+                self.post_command("cmd_vel", (0, 0, z))
+
+            # VECTOR FIELD HISTOGRAM STEERING MODE
+            elif self.running_mode == 4:
+                hist = self.vfh.build(geometry, ranges, lidar_data.range_min, lidar_data.range_max)
+                heading = self.vfh.select(hist)
+                self.steer(hist, heading)
+                vfh_debug = hist, heading
+
+            # TIME-TO-COLLISION CRUISE MODE
+            elif self.running_mode == 5:
+                obstacle = geometry.forward_clearance(ranges, lidar_data.range_min, lidar_data.range_max)
+
+                now = time.monotonic()
+                if not self.turn.finished(now):
+                    self.turn.observe(obstacle)
+                    return
+
+                self.cruise(obstacle, now)
+
+        if vfh_debug is not None:
+            self.publish_vfh(*vfh_debug)
 
 
 if __name__ == "__main__":
+    setup_logging()
     node = LidarController('lidar_app')
     
     # Register signal handlers for clean shutdown
@@ -486,3 +782,5 @@ if __name__ == "__main__":
     finally:
         node.shutdown_hook()
         rospy.loginfo("Exiting...")
+        timeline.save()
+        shutdown_logging()
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # unified_robot_startup.py - Complete startup and teleoperation script
 import sys
+import signal
 import subprocess
-import rospy
 import time
 import os
 import threading
@@ -10,155 +10,307 @@ import threading
 # Add the parent directory to sys.path to allow imports if run directly
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# The boot timeline starts before the heavy imports so they are on it too
+from src.config import BOOT_REPORT_DIR, BOOT_REPORT_KEEP
+from src.utils.timeline import BootTimeline, IMPORT, STEP, WAIT
+timeline = BootTimeline("main", BOOT_REPORT_DIR, BOOT_REPORT_KEEP)
+timeline.preload("numpy", "rospy", "rosgraph", "requests", "PIL.Image", "firebase_admin", "firebase_admin.db")
+
+import rospy
+import rosgraph
+import xmlrpc.client
+
+timeline.begin("import src", IMPORT)
 from src.config import (
     ROBOT_ID, SERVICE_ACCOUNT_PATH, DATABASE_URL, 
-    HTML_FILENAME, WEB_SERVER_PORT
+    HTML_FILENAME, WEB_SERVER_PORT, TELEOP_PUBLISH_RATE,
+    TELEOP_STALE_TIMEOUT, TELEOP_STOP_RAMP, TELEOP_ACK_RATE,
+    TELEOP_STATUS_INTERVAL, LAN_COMMAND_PORT, LAN_COMMAND_TIMEOUT,
+    TELEOP_COLLISION_TTC, TELEOP_STOP_DISTANCE, TELEOP_BLIND_SPEED
+)
+from src.utils.network import (
+    wait_for_internet, register_session, load_cached_session, validate_session, backoff_delays
 )
-from src.utils.network import wait_for_internet, register_session
 from src.utils.oled import OLEDDisplay
-from src.utils.web_server import start_web_server
+from src.utils.web_server import start_web_server, start_command_endpoint, new_lan_key
 from src.utils.firebase_controller import FirebaseJetHexaController
+from src.utils.log import setup_logging, shutdown_logging, get_logger
+from src.utils.startup import StartupGraph, port_open
+from src.utils.supervisor import Supervisor, RESTART_ON_FAILURE
+timeline.end("import src")
 
-def main():
-    print("=" * 60)
-    print("🚀 JetHexa Robot Startup Sequence")
-    print("=" * 60)
-    
-    # STEP 1: Stop the default JetHexa service first
-    print("🛑 Stopping default jethexa_bringup.service...")
-    try:
-        subprocess.run(['sudo', 'systemctl', 'stop', 'jethexa_bringup.service'], check=True)
-        print("✅ jethexa_bringup.service stopped")
-        time.sleep(5)  # Give it a moment to fully stop
-    except subprocess.CalledProcessError as e:
-        print(f"⚠️ Warning: Could not stop jethexa_bringup.service: {e}")
-    
-    # STEP 2: Start roscore
-    print("🚀 Starting roscore...")
-    try:
-        # Start roscore in background
-        subprocess.Popen(['roscore'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print("✅ roscore started")
-        time.sleep(5)  # Give roscore time to fully initialize
-    except Exception as e:
-        print(f"⚠️ Warning: Could not start roscore: {e}")
-    
-    # STEP 3: Start base launch file - ROBOT STANDS HERE (NO INTERNET NEEDED!)
-    print("🤖 Starting jethexa base controller...")
+log = get_logger("main")
+
+# Owns roscore, base.launch and Chromium: restarts them when they die or stop
+# answering, and takes them down with us
+supervisor = Supervisor(status_interval=60.0)
+
+BRINGUP_SERVICE = 'jethexa_bringup.service'
+# Topics the base controller subscribes to once base.launch is up
+CONTROLLER_TOPICS = ('/jethexa_controller/cmd_vel', '/jethexa_controller/traveling')
+# OLED node started by base.launch, stopped so we can drive the display
+OLED_NODES = ('/oled_display/oled_display_node', '/oled_display')
+# How long to wait for the OLED node to come up before giving up on it
+OLED_NODE_WAIT = 5.0
+
+
+# Master calls made by probes give up after this long, so a wedged master
+# can't hang the startup graph or the supervisor
+MASTER_TIMEOUT = 2.0
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self.timeout
+        return conn
+
+
+def master_call(method, *args):
+    """Call the ROS master over XML-RPC with MASTER_TIMEOUT; returns the value"""
+    master = xmlrpc.client.ServerProxy(rosgraph.get_master_uri(), transport=_TimeoutTransport(MASTER_TIMEOUT))
+    code, message, value = getattr(master, method)('/jethexa_startup', *args)
+    if code != 1:
+        raise RuntimeError("{} failed: {}".format(method, message))
+    return value
+
+
+def master_online():
     try:
-        subprocess.Popen(['roslaunch', 'jethexa_bringup', 'base.launch'], 
-                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print("✅ Base controller started")
-        time.sleep(8)  # Wait for controller to initialize and auto-stand
-        print("✅ Robot should be standing NOW (before internet check)")
-        
-        # Kill the default OLED display node so we can control it
-        print("🔧 Stopping all OLED display nodes...")
-        try:
-            # Specifically kill the known OLED node
-            oled_nodes = ['/oled_display/oled_display_node', '/oled_display']
-            
-            for node in oled_nodes:
-                try:
-                    print(f"🔧 Attempting to kill node: {node}")
-                    result = subprocess.run(['rosnode', 'kill', node], 
-                                          capture_output=True, text=True, timeout=3)
-                    if result.returncode == 0:
-                        print(f"✅ Killed node: {node}")
-                    else:
-                        print(f"⚠️ Node {node} not found or already stopped")
-                except Exception as e:
-                    print(f"⚠️ Could not kill {node}: {e}")
-            
-            time.sleep(2)
-            print("✅ OLED node cleanup complete")
-        except Exception as e:
-            print(f"⚠️ Error stopping OLED nodes: {e}")
-            
-    except Exception as e:
-        print(f"⚠️ Warning: Could not start base controller: {e}")
-    
-    # STEP 4: Initialize OLED display
-    oled = OLEDDisplay()
-    oled_available = oled.initialize()
-    
-    if oled_available:
-        print("🧹 Clearing OLED screen completely...")
-        # Clear multiple times to ensure old content is gone
-        for _ in range(3):
-            oled.clear_screen()
-            time.sleep(0.2)
-        print("✅ OLED cleared and ready")
-    
-    # STEP 5: NOW check internet connection (robot is already standing!)
-    print("\n" + "=" * 60)
-    print("🤖 Robot is standing and functional!")
-    print("🌐 Now checking internet for remote control...")
-    print("=" * 60 + "\n")
-    
-    if oled_available:
-        oled.start_continuous_display("No WiFi")
-    
-    wait_for_internet()
-    
-    # STEP 6: Register session and get PIN
-    if oled_available:
-        oled.display_message("Getting PIN...")
-    
-    session_code, agora_channel = register_session()
-    
-    if not session_code:
-        print("❌ Failed to retrieve session code. Exiting...")
-        if oled_available:
-            oled.display_message("Reg Failed")
-        return
-    
-    # STEP 7: Display PIN on OLED
-    if oled_available:
-        oled.stop_display()
-        oled.start_continuous_display(f"PIN:{session_code}")
-    
-    print(f"\n{'=' * 60}")
-    print(f"📌 Session Code: {session_code}")
-    print(f"📺 Agora Channel: {agora_channel}")
-    print(f"{'=' * 60}\n")
-    
-    # Wait a moment for PIN to be visible
-    time.sleep(2)
-    
-    # STEP 8: Check if service account file exists
-    if not os.path.exists(SERVICE_ACCOUNT_PATH):
-        print(f"❌ Service account file not found: {SERVICE_ACCOUNT_PATH}")
-        if oled_available:
-            oled.display_message("Config Error")
+        master_call('getPid')
+        return True
+    except Exception:
+        return False
+
+
+def ros_system_state():
+    """(publishers, subscribers, services) from the ROS master"""
+    return master_call('getSystemState')
+
+
+def ros_nodes():
+    return {node for entries in ros_system_state() for _, nodes in entries for node in nodes}
+
+
+def stop_bringup():
+    subprocess.run(['sudo', 'systemctl', 'stop', BRINGUP_SERVICE], check=True)
+
+
+def bringup_stopped():
+    return subprocess.run(['systemctl', 'is-active', '--quiet', BRINGUP_SERVICE]).returncode != 0
+
+
+def start_roscore():
+    if master_online():
+        log.info("✅ roscore already running")  # Not ours to supervise
         return
-    
-    # STEP 9: Start web server
-    print("\n🌐 Starting web server...")
-    start_web_server()
-    print(f"📄 HTML file accessible at: http://localhost:{WEB_SERVER_PORT}/{HTML_FILENAME}")
-    
-    # Launch Chromium with full path
-    subprocess.Popen([
+    supervisor.add('roscore', ['roscore'], probe=master_online, grace=20.0)
+    supervisor.start('roscore')
+
+
+def start_base():
+    # ROBOT STANDS HERE (NO INTERNET NEEDED!)
+    requires = ('roscore',) if 'roscore' in supervisor.processes else ()
+    supervisor.add('base', ['roslaunch', 'jethexa_bringup', 'base.launch'], probe=controller_ready,
+                   grace=30.0, requires=requires, on_running=base_running)
+    supervisor.start('base')
+
+
+def base_running(proc):
+    # A restarted base.launch brings the OLED node back over our display
+    if proc.restarts:
+        kill_oled_nodes()
+
+
+def controller_ready():
+    subscribed = {topic for topic, _ in ros_system_state()[1]}
+    return all(topic in subscribed for topic in CONTROLLER_TOPICS)
+
+
+def kill_oled_nodes():
+    """Kill the default OLED display node once base.launch has started it"""
+    deadline = time.monotonic() + OLED_NODE_WAIT
+    running = ros_nodes().intersection(OLED_NODES)
+    while not running and time.monotonic() < deadline:
+        time.sleep(0.2)
+        running = ros_nodes().intersection(OLED_NODES)
+    for node in running:
+        log.info("🔧 Attempting to kill node: %s", node)
+        result = subprocess.run(['rosnode', 'kill', node], capture_output=True, text=True, timeout=3)
+        if result.returncode == 0:
+            log.info("✅ Killed node: %s", node)
+        else:
+            log.warning("⚠️ Node %s not found or already stopped", node)
+
+
+def oled_nodes_stopped():
+    return not ros_nodes().intersection(OLED_NODES)
+
+
+def open_browser():
+    # Chromium exits with 0 when it hands the URL to a browser that is already open
+    supervisor.add('chromium', [
        '/usr/bin/chromium-browser',
        '--password-store=basic',
        f'http://localhost:{WEB_SERVER_PORT}/{HTML_FILENAME}'
-    ])
-    print(f"🌐 Opening {HTML_FILENAME} in Chromium...")
-    
-    # STEP 10: Start teleoperation controller
+    ], restart=RESTART_ON_FAILURE, backoff=2.0, max_restarts=5)
+    supervisor.start('chromium')
+    log.info("🌐 Opening %s in Chromium...", HTML_FILENAME)
+
+
+def build_startup(oled):
+    """Startup steps: ROS bringup, OLED, internet + registration and the web server run side by side"""
+    def init_oled():
+        if not oled.initialize():
+            raise RuntimeError("OLED not available")
+        oled.start_continuous_display(oled.current_message or "No WiFi")
+
+    def connect():
+        log.info("🌐 Checking internet for remote control...")
+        wait_for_internet()
+
+    def register():
+        session_code = agora_channel = None
+        if cached is not None:
+            session_code, agora_channel = validate_session(cached)
+        reused = session_code is not None
+        # Without a session there is nothing to run: keep trying, with backoff
+        delays = backoff_delays(base=2.0, cap=30.0)
+        while not session_code and graph.running("register"):
+            oled.show("Getting PIN...")
+            session_code, agora_channel = register_session()
+            if not session_code:
+                oled.show("Reg Failed")
+                delay = next(delays)
+                log.warning("⚠️ Registration failed, retrying in %.0f s", delay)
+                time.sleep(delay)
+        if not graph.running("register"):
+            raise RuntimeError("Registration step abandoned")
+        # The PIN goes up as soon as we have it, whatever ROS is doing
+        oled.show(f"PIN:{session_code}")
+        log.info("=" * 60)
+        log.info("📌 Session Code: %s", session_code)
+        log.info("📺 Agora Channel: %s", agora_channel)
+        log.info("=" * 60)
+        return session_code, agora_channel, reused
+
+    # A session cached by the last boot goes up right away; register()
+    # checks it is still valid once we are online and replaces it if not
+    cached = load_cached_session()
+    oled.current_message = f"PIN:{cached['session_code']}" if cached else "No WiFi"
+    graph = StartupGraph()
+    graph.add("stop_bringup", stop_bringup, ready=bringup_stopped, timeout=20.0, optional=True)
+    graph.add("roscore", start_roscore, deps=("stop_bringup",), ready=master_online, timeout=20.0)
+    graph.add("base", start_base, deps=("roscore",), ready=controller_ready, timeout=30.0, optional=True)
+    graph.add("oled_nodes", kill_oled_nodes, deps=("base",), ready=oled_nodes_stopped,
+              timeout=OLED_NODE_WAIT + 10.0, optional=True)
+    graph.add("oled", init_oled, timeout=10.0, optional=True)
+    graph.add("internet", connect, timeout=None)  # Wait for WiFi as long as it takes
+    graph.add("register", register, deps=("internet",), timeout=None)  # Retries until it gets a PIN
+    graph.add("web_server", start_web_server, ready=lambda: port_open(WEB_SERVER_PORT), timeout=10.0)
+    # The page looks up the latest session, so it opens after registration
+    graph.add("chromium", open_browser, deps=("web_server", "register"), optional=True)
+    return graph
+
+
+def main():
+    log.info("=" * 60)
+    log.info("🚀 JetHexa Robot Startup Sequence")
+    log.info("=" * 60)
+
+    oled = OLEDDisplay()
+    graph = build_startup(oled)
+    graph.run()
+    for name, status, offset, duration in graph.report():
+        log.info("  %-12s %-8s start %5.1f s  took %5.1f s", name, status, offset or 0.0, duration or 0.0)
+    for step in graph.steps.values():
+        if step.started is not None:
+            # How long the internet wait takes is up to the WiFi, not to us
+            kind = WAIT if step.name == "internet" else STEP
+            timeline.span(step.name, step.started, step.finished or time.monotonic(), kind=kind, status=step.status)
+    timeline.save()
+
+    if not graph.ready("base"):
+        log.warning("⚠️ Warning: base controller not confirmed, continuing anyway")
+
+    if not graph.ready("register"):
+        log.error("❌ Failed to retrieve session code. Exiting...")
+        oled.show("Reg Failed")
+        return
+    session_code, agora_channel, reused = graph.result("register")
+
+    if not graph.ready("roscore"):
+        log.error("❌ ROS master not reachable. Exiting...")
+        oled.show("ROS Error")
+        return
+
+    # Check if service account file exists
+    if not os.path.exists(SERVICE_ACCOUNT_PATH):
+        log.error("❌ Service account file not found: %s", SERVICE_ACCOUNT_PATH)
+        oled.show("Config Error")
+        return
+
+    if graph.ready("web_server"):
+        log.info("📄 HTML file accessible at: http://localhost:%d/%s", WEB_SERVER_PORT, HTML_FILENAME)
+
+    # Start teleoperation controller (rospy.init_node has to run on the main thread)
     try:
-        print("\n🤖 Starting teleoperation controller...")
+        log.info("🤖 Starting teleoperation controller...")
         # Keep displaying the PIN on OLED - don't stop it
         
-        controller = FirebaseJetHexaController(SERVICE_ACCOUNT_PATH, DATABASE_URL, ROBOT_ID, session_code)
+        def first_command(source):
+            # Depends on when an operator connects
+            timeline.mark("first_command", WAIT, source=source)
+            timeline.save()
+
+        timeline.begin("firebase_init")
+        controller = FirebaseJetHexaController(SERVICE_ACCOUNT_PATH, DATABASE_URL, ROBOT_ID, session_code,
+                                               publish_rate=TELEOP_PUBLISH_RATE,
+                                               stale_timeout=TELEOP_STALE_TIMEOUT,
+                                               stop_ramp=TELEOP_STOP_RAMP,
+                                               ack_rate=TELEOP_ACK_RATE,
+                                               status_interval=TELEOP_STATUS_INTERVAL,
+                                               lan_timeout=LAN_COMMAND_TIMEOUT,
+                                               collision_ttc=TELEOP_COLLISION_TTC,
+                                               collision_stop_distance=TELEOP_STOP_DISTANCE,
+                                               collision_blind_speed=TELEOP_BLIND_SPEED,
+                                               on_first_command=first_command)
+        timeline.end("firebase_init")
+        # Operators on the same network can skip the cloud round trip
+        with timeline.phase("lan_endpoint"):
+            lan_key = new_lan_key()
+            if start_command_endpoint(lan_key, controller.on_lan_command, LAN_COMMAND_PORT) is not None:
+                controller.publish_lan_key(lan_key, LAN_COMMAND_PORT)
+        timeline.save()
+        if reused:
+            # Whatever the last boot was told to do is not a command for this one
+            controller.clear_commands()
         controller.start_listening()
         
     except Exception as e:
-        print(f"❌ Error: {e}")
-        if oled_available:
-            oled.display_message("Error!")
+        timeline.end("firebase_init", status="error", error=str(e))
+        log.error("❌ Error: %s", e)
+        oled.show("Error!")
         rospy.logerr(str(e))
 
 if __name__ == "__main__":
-    main()
+    setup_logging()
+    # Children run in their own process groups, so a SIGTERM has to unwind
+    # through the finally below to take them down (rospy chains to this)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        main()
+        # Without a remote session the robot still stands and the lidar
+        # controller still runs: keep supervising until we are stopped
+        while supervisor.processes and not rospy.is_shutdown():
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        timeline.save()
+        supervisor.stop()
+        shutdown_logging()
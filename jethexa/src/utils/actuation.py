@@ -0,0 +1,46 @@
+import threading
+import time
+
+
+class CommandMailbox:
+    """Single-slot, latest-wins handoff between a producer and an actuator thread
+
+    put() never blocks. If the previous command has not been picked up yet it
+    is replaced and counted as superseded, so the actuator only ever sees the
+    newest decision instead of working through a backlog.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._command = None
+        self._stamp = 0.0
+        self.posted = 0
+        self.superseded = 0
+        self.taken = 0
+
+    def put(self, command, stamp=None):
+        """Store command (any non-None object), replacing an unread one"""
+        with self._cond:
+            if self._command is not None:
+                self.superseded += 1
+            self._command = command
+            self._stamp = time.monotonic() if stamp is None else stamp
+            self.posted += 1
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """Wait for the next command; returns (command, stamp) or None on timeout"""
+        with self._cond:
+            if self._command is None:
+                self._cond.wait(timeout)
+            if self._command is None:
+                return None
+            command, stamp = self._command, self._stamp
+            self._command = None
+            self.taken += 1
+            return command, stamp
+
+    def clear(self):
+        """Drop an unread command without counting it as superseded"""
+        with self._cond:
+            self._command = None
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+from .log import get_logger
+
+log = get_logger("buttons")
+
+
+class FakeGPIO:
+    """Minimal Jetson.GPIO stand-in so button handling runs off-robot
+
+    press()/release() drive a pin like the physical button would, firing any
+    edge callbacks registered with add_event_detect().
+    """
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        self._levels = {}
+        self._events = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self._levels[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+
+    def input(self, pin):
+        return self._levels.get(pin, self.HIGH)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._events[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self._events.pop(pin, None)
+
+    def cleanup(self, *pins):
+        self._events.clear()
+
+    def _set(self, pin, level):
+        if self._levels.get(pin, self.HIGH) == level:
+            return
+        self._levels[pin] = level
+        edge, callback = self._events.get(pin, (None, None))
+        fired = self.FALLING if level == self.LOW else self.RISING
+        if callback is not None and edge in (fired, self.BOTH):
+            callback(pin)
+
+    def press(self, pin):
+        self._set(pin, self.LOW)
+
+    def release(self, pin):
+        self._set(pin, self.HIGH)
+
+
+def load_gpio():
+    """Jetson.GPIO on the robot, FakeGPIO only if JETHEXA_FAKE_GPIO is set
+
+    A missing Jetson.GPIO is an error: with a fake backend KEY2 would never
+    fire and the lidar controller would wait for it forever.
+    """
+    if os.environ.get("JETHEXA_FAKE_GPIO"):
+        log.warning("⚠️ JETHEXA_FAKE_GPIO set, using fake GPIO backend")
+        return FakeGPIO()
+    import Jetson.GPIO as GPIO
+    return GPIO
+
+
+class ButtonDispatcher:
+    """Delivers presses of an active-low button to subscribers
+
+    Uses the GPIO library's falling-edge callbacks instead of polling. On top
+    of the driver's bouncetime, a press is only accepted if the pin still
+    reads low when the callback runs and at least debounce seconds have
+    passed since the previous accepted press.
+    """
+
+    def __init__(self, gpio, pin, debounce=0.3):
+        self.gpio = gpio
+        self.pin = pin
+        self.debounce = debounce
+        self.presses = 0
+        self.bounces = 0
+        self._last_press = -debounce
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        self.gpio.add_event_detect(self.pin, self.gpio.FALLING, callback=self._on_edge,
+                                   bouncetime=max(1, int(self.debounce * 1000 / 6)))
+
+    def stop(self):
+        try:
+            self.gpio.remove_event_detect(self.pin)
+        except Exception:
+            pass
+
+    def subscribe(self, callback):
+        """Call callback() on every accepted press; returns a function that unsubscribes"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def wait_for_press(self, timeout=None):
+        """Block until the next press; returns False on timeout"""
+        pressed = threading.Event()
+        unsubscribe = self.subscribe(pressed.set)
+        try:
+            return pressed.wait(timeout)
+        finally:
+            unsubscribe()
+
+    def _on_edge(self, channel):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_press < self.debounce or self.gpio.input(self.pin) != self.gpio.LOW:
+                self.bounces += 1
+                return
+            self._last_press = now
+            self.presses += 1
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback()
+            except Exception as e:
+                log.exception("❌ Button %d handler error: %s", self.pin, e)
@@ -0,0 +1,121 @@
+import math
+import threading
+import numpy as np
+
+from .lidar_perception import CORRIDOR_HALF_WIDTH, TRACK_MIN_DIST
+from .log import get_logger
+
+log = get_logger("collision")
+
+
+class CollisionGovernor:
+    """Limits teleop velocity so the robot cannot walk into what the lidar sees
+
+    Every scan is reduced to the closest return per angular sector, keeping
+    only sectors that have one. For a commanded (vx, vy), the sectors inside
+    the corridor swept along the direction of motion give the free distance
+    ahead. The speed is capped so the time to reach stop_distance from the
+    obstacle stays at least ttc seconds; inside stop_distance the linear
+    motion is clamped to zero. Rotation is never touched, and motion with
+    more than ttc seconds of clearance passes through unchanged. Without a
+    scan newer than scan_timeout (the lidar driver is not up yet, or died)
+    the robot is driving blind, and the speed is capped to blind_speed.
+    """
+
+    def __init__(self, sectors=72, half_width=CORRIDOR_HALF_WIDTH, ttc=1.5, stop_distance=0.35,
+                 ignore_within=TRACK_MIN_DIST, scan_timeout=0.5, blind_speed=0.03):
+        self.sectors = sectors
+        self.half_width = half_width
+        self.ttc = ttc
+        self.stop_distance = stop_distance
+        self.ignore_within = ignore_within  # Legs / body returns
+        self.scan_timeout = scan_timeout
+        self.blind_speed = blind_speed
+        self.blind = False  # Last govern() had no recent scan
+        self.sector_width = 2 * math.pi / sectors
+        centres = -math.pi + (np.arange(sectors) + 0.5) * self.sector_width
+        self._centre_cos = np.cos(centres)
+        self._centre_sin = np.sin(centres)
+        # A return can be up to half a sector off the centre line
+        self._slack = math.sin(self.sector_width / 2)
+        self._geometry = None
+        self._lock = threading.Lock()
+        # (ranges, cos, sin, stamp) of the occupied sectors of the last scan
+        self._occupied = None
+
+        self.checks = 0
+        self.interventions = 0
+        self.stops = 0
+        self.no_scan = 0
+        self.min_scale = 1.0
+        self._reduction = 0.0
+
+    def _index(self, geometry):
+        # Beams sorted by sector so one reduceat gives every sector's minimum
+        angles = np.arctan2(geometry.sin, geometry.cos)
+        idx = ((angles + math.pi) / self.sector_width).astype(np.intp) % self.sectors
+        self._order = np.argsort(idx, kind='stable')
+        sorted_idx = idx[self._order]
+        self._starts = np.flatnonzero(np.r_[True, sorted_idx[1:] != sorted_idx[:-1]])
+        self._present = sorted_idx[self._starts]
+        self._geometry = geometry
+
+    def update_scan(self, geometry, ranges, range_min, range_max, now):
+        """Reduce one scan to per-sector minimum ranges"""
+        if geometry is not self._geometry:
+            self._index(geometry)
+        r = ranges[self._order]
+        r = np.where((r >= max(range_min, self.ignore_within)) & (r < range_max), r, np.inf)
+        mins = np.minimum.reduceat(r, self._starts)
+        occupied = np.isfinite(mins)
+        sectors = self._present[occupied]
+        with self._lock:
+            self._occupied = (mins[occupied], self._centre_cos[sectors], self._centre_sin[sectors], now)
+
+    def govern(self, vx, vy, now):
+        """Return the (vx, vy) that is safe to send for the commanded one"""
+        self.checks += 1
+        speed = math.hypot(vx, vy)
+        if speed == 0:
+            return vx, vy
+        with self._lock:
+            occupied = self._occupied
+        self.blind = occupied is None or now - occupied[3] > self.scan_timeout
+        if self.blind:
+            self.no_scan += 1
+            log.warning("⚠️ No recent lidar scan - teleop limited to %.2f m/s", self.blind_speed,
+                        key='no_scan', every=5.0)
+            if speed <= self.blind_speed:
+                return vx, vy
+            scale = self.blind_speed / speed
+            return vx * scale, vy * scale
+
+        r, c, s, _ = occupied
+        ux, uy = vx / speed, vy / speed
+        along = r * (c * ux + s * uy)
+        lateral = np.abs(r * (s * ux - c * uy))
+        ahead = (along > 0) & (lateral < self.half_width + r * self._slack)
+        if not ahead.any():
+            return vx, vy
+
+        clearance = float(along[ahead].min()) - self.stop_distance
+        allowed = clearance / self.ttc
+        if speed <= allowed:
+            return vx, vy
+        scale = max(allowed / speed, 0.0)
+        self.interventions += 1
+        self._reduction += 1.0 - scale
+        self.min_scale = min(self.min_scale, scale)
+        if scale == 0:
+            self.stops += 1
+        return vx * scale, vy * scale
+
+    def metrics(self):
+        return {
+            'checks': self.checks,
+            'interventions': self.interventions,
+            'stops': self.stops,
+            'no_scan': self.no_scan,
+            'mean_reduction': self._reduction / self.interventions if self.interventions else 0.0,
+            'min_scale': self.min_scale,
+        }
@@ -0,0 +1,88 @@
+VELOCITY_FIELDS = ('vx', 'vy', 'yaw')
+FLAG_FIELDS = (
+    'walk_forward', 'walk_backward',
+    'strafe_left', 'strafe_right',
+    'turn_left', 'turn_right',
+    'emergency_stop',
+)
+COMMAND_FIELDS = VELOCITY_FIELDS + FLAG_FIELDS
+# Sender metadata, tracked alongside the command but not part of it
+META_FIELDS = ('seq', 'timestamp')
+
+
+class CommandRecord:
+    """Teleop command state updated in place from Firebase stream events
+
+    Holds a fixed set of fields. apply() takes the event type, path and data
+    of a put or patch event relative to the listened node and returns the
+    names of the fields whose value actually changed, so the caller never
+    has to refetch or diff the whole state. Deleted or missing fields fall
+    back to their default (not moving), and unknown fields are ignored.
+    """
+
+    __slots__ = COMMAND_FIELDS + META_FIELDS
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        for name in COMMAND_FIELDS + META_FIELDS:
+            setattr(self, name, self._default(name))
+
+    @staticmethod
+    def _default(name):
+        if name in VELOCITY_FIELDS:
+            return 0.0
+        if name in FLAG_FIELDS:
+            return False
+        return None
+
+    @staticmethod
+    def _coerce(name, value):
+        if value is None:
+            return CommandRecord._default(name)
+        if name in FLAG_FIELDS:
+            return bool(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return CommandRecord._default(name)
+        if name == 'seq':
+            return int(value)
+        return float(value)
+
+    def _set(self, name, value, changed):
+        value = self._coerce(name, value)
+        if getattr(self, name) != value:
+            setattr(self, name, value)
+            changed.append(name)
+
+    def apply(self, event_type, path, data):
+        """Apply one stream event; returns the list of changed field names"""
+        parts = [p for p in (path or '/').split('/') if p]
+        changed = []
+
+        if not parts:
+            if event_type == 'patch':
+                # Merge: only the listed children change
+                if isinstance(data, dict):
+                    for name, value in data.items():
+                        if name in self.__slots__:
+                            self._set(name, value, changed)
+            else:
+                # Put at the root replaces the whole node
+                data = data if isinstance(data, dict) else {}
+                for name in self.__slots__:
+                    self._set(name, data.get(name), changed)
+        elif len(parts) == 1 and parts[0] in self.__slots__:
+            name = parts[0]
+            if event_type == 'patch':
+                # Patching children of a scalar field has no meaning here
+                return changed
+            self._set(name, data, changed)
+        return changed
+
+    def command(self):
+        """Snapshot of the command fields as a dict"""
+        return {name: getattr(self, name) for name in COMMAND_FIELDS}
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
@@ -1,17 +1,41 @@
 import time
 import os
+import threading
 import rospy
+import numpy as np
+from rospy.numpy_msg import numpy_msg
 import firebase_admin
 from firebase_admin import credentials, db
 from geometry_msgs.msg import Twist
+from std_msgs.msg import Bool
+from sensor_msgs.msg import LaserScan
 from jethexa_controller_interfaces.msg import Traveling
+from .latency import LatencyHistogram
+from .command_state import CommandRecord, COMMAND_FIELDS
+from .log import get_logger
+from . import mux
+from . import lidar_perception
+from .collision import CollisionGovernor
+
+log = get_logger("teleop")
 
 class FirebaseJetHexaController:
-    def __init__(self, service_account_path, database_url, robot_id, session_code):
+    def __init__(self, service_account_path, database_url, robot_id, session_code, publish_rate=20.0,
+                 stale_timeout=1.0, stop_ramp=0.5, ack_rate=5.0,
+                 status_interval=5.0, lan_timeout=0.5, keepalive=0.2,
+                 collision_ttc=1.5, collision_stop_distance=0.35, collision_blind_speed=0.03,
+                 on_first_command=None):
         """Initialize Firebase connection and ROS publishers"""
         try:
             self.robot_id = robot_id
             self.session_code = session_code
+            self.publish_rate = publish_rate
+            self.stale_timeout = stale_timeout
+            self.stop_ramp = stop_ramp
+            self.ack_rate = ack_rate
+            self.status_interval = status_interval
+            self.lan_timeout = lan_timeout
+            self.keepalive = keepalive
             
             # Initialize Firebase Admin SDK
             cred = credentials.Certificate(service_account_path)
@@ -25,10 +49,11 @@ class FirebaseJetHexaController:
             
             # Get database reference using session-based path
             self.commands_ref = db.reference(f'sessions/{session_code}/robot_commands/latest')
-            print(f"✅ Connected to Firebase successfully!")
-            print(f"🤖 Monitoring robot: {robot_id}")
-            print(f"📍 Session: {session_code}")
-            print(f"📂 Firebase path: sessions/{session_code}/robot_commands/latest")
+            self.ack_ref = db.reference(f'sessions/{session_code}/robot_commands/ack')
+            log.info("✅ Connected to Firebase successfully!")
+            log.info("🤖 Monitoring robot: %s", robot_id)
+            log.info("📍 Session: %s", session_code)
+            log.info("📂 Firebase path: sessions/%s/robot_commands/latest", session_code)
             
             # Initialize ROS node and publishers
             # Note: init_node should usually be called once per process. 
@@ -39,193 +64,455 @@ class FirebaseJetHexaController:
             if rospy.get_node_uri() is None:
                 rospy.init_node('firebase_jethexa_controller_node')
             
-            topic_prefix = rospy.get_param("~topic_prefix", "jethexa_controller")
+            # Commands go through command_mux.py as the teleop source; set
+            # ~topic_prefix to jethexa_controller to drive the robot directly
+            topic_prefix = rospy.get_param("~topic_prefix", mux.source_prefix(mux.TELEOP))
             self.cmd_vel_pub = rospy.Publisher(topic_prefix + '/cmd_vel', Twist, queue_size=1)
             self.traveling_pub = rospy.Publisher(topic_prefix + '/traveling', Traveling, queue_size=1)
-            print("✅ ROS publishers initialized!")
+            self.estop_pub = mux.estop_publisher()
+            self.estop_engaged = False
+            log.info("✅ ROS publishers initialized!")
             
             # Initialize control state
-            self.current_command = {
-                'vx': 0, 'vy': 0, 'yaw': 0,
-                'walk_forward': False, 'walk_backward': False,
-                'strafe_left': False, 'strafe_right': False,
-                'turn_left': False, 'turn_right': False,
-                'emergency_stop': False
-            }
+            # Patched in place from each stream event; no refetching
+            self.command = CommandRecord()
             
             self.msg = Twist()
+            self.last_twist_publish = 0.0
+            self.requested = (0.0, 0.0, 0.0)  # Operator's twist before the collision governor
+            
+            # Collision governor: caps the speed towards whatever the lidar
+            # sees (collision_ttc <= 0 turns it off)
+            self.governor = None
+            if collision_ttc > 0:
+                self.governor = CollisionGovernor(ttc=collision_ttc, stop_distance=collision_stop_distance,
+                                                  blind_speed=collision_blind_speed)
+                self.scan_geometry = lidar_perception.GeometryCache()
+                self.lidar_type = os.environ.get("LIDAR_TYPE", "RPLIDAR")
+                self.scan_sub = rospy.Subscriber(rospy.get_param("~scan_topic", "scan"), numpy_msg(LaserScan),
+                                                 self.scan_callback, queue_size=1)
+            
+            # The Firebase listener thread only patches self.command and marks
+            # it dirty; publish_loop publishes the latest state at publish_rate,
+            # so a burst of events collapses into one publish
+            self.state_lock = threading.Lock()
+            self.dirty = False
+            self.running = False
+            self.publish_thread = None
+            self.events_received = 0
+            self.on_first_command = on_first_command  # Called once with the source, e.g. for the boot timeline
+            self.events_coalesced = 0
+            self.commands_published = 0
+            
+            # Dead-man watchdog: if no command arrives for stale_timeout seconds
+            # while moving, ramp the published velocity to zero over stop_ramp
+            self.last_command_time = None
+            self.max_command_gap = 0.0
+            self.watchdog_tripped = False
+            self.watchdog_trips = 0
+            self.ramp_start = 0.0
+            self.ramp_from = (0.0, 0.0, 0.0)
+            
+            # Latency tracking from the optional sender seq / timestamp (ms since
+            # epoch). One-way figures compare the sender's clock with ours and
+            # need both synced (NTP); the ack lets the sender measure round trip
+            # time on its own clock.
+            self.last_seq = None
+            self.pending_seq = None  # (seq, sender time, receive monotonic, reply) awaiting publish
+            self.seq_gaps = 0
+            self.seq_reordered = 0
+            self.pending_ack = None
+            self.acks_written = 0
+            self.ack_thread = None
+            self.latency = {
+                'network': LatencyHistogram(),    # sender -> Firebase callback
+                'dispatch': LatencyHistogram(),   # callback -> cmd_vel publish
+                'end_to_end': LatencyHistogram(), # sender -> cmd_vel publish
+            }
+            
+            # Commands can also arrive over the LAN endpoint (web_server.py).
+            # While LAN commands are fresh (within lan_timeout) they win and
+            # Firebase events, which lag behind them, are ignored; when the LAN
+            # goes quiet Firebase takes over again
+            self.command_source = None
+            self.last_lan_time = None
+            self.lan_commands = 0
+            self.firebase_ignored = 0
+            self.source_switches = 0
             
         except Exception as e:
-            print(f"❌ Error initializing Firebase or ROS: {e}")
+            log.error("❌ Error initializing Firebase or ROS: %s", e)
             raise
 
-    def send_movement_command(self):
-        """Send movement command based on current command state"""
-        print("\n🎮 PROCESSING MOVEMENT COMMAND")
-        print("-" * 60)
+    def send_movement_command(self, command):
+        """Send movement command based on a snapshot of the command state"""
+        self.commands_published += 1
         
-        if self.current_command.get('emergency_stop', False):
-            print("🛑 EMERGENCY STOP ACTIVATED")
-            self.msg.linear.x = 0.0
-            self.msg.linear.y = 0.0
-            self.msg.angular.z = 0.0
-            self.cmd_vel_pub.publish(self.msg)
-            print("✅ Stop command published to ROS")
-            return
+        estop = bool(command.get('emergency_stop', False))
+        if estop != self.estop_engaged:
+            self.estop_engaged = estop
+            self.estop_pub.publish(Bool(data=estop))
         
-        vx = self.current_command.get('vx', 0)
-        vy = self.current_command.get('vy', 0)
-        yaw = self.current_command.get('yaw', 0)
+        if estop:
+            log.warning("🛑 EMERGENCY STOP ACTIVATED", key='estop', every=1.0)
+            self.requested = (0.0, 0.0, 0.0)
+            self.publish_twist(0.0, 0.0, 0.0)
+            return
         
-        print(f"📊 Raw values - VX: {vx}, VY: {vy}, Yaw: {yaw}")
+        vx = command.get('vx', 0)
+        vy = command.get('vy', 0)
+        yaw = command.get('yaw', 0)
         
         if vx == 0 and vy == 0 and yaw == 0:
-            print("🔍 Checking boolean flags...")
-            if self.current_command.get('walk_forward', False):
-                print("🤖 Moving Forward (from flag)")
+            # No analog values: fall back to the boolean flags
+            if command.get('walk_forward', False):
                 vx = 0.08
-            elif self.current_command.get('walk_backward', False):
-                print("🤖 Moving Backward (from flag)")
+            elif command.get('walk_backward', False):
                 vx = -0.08
             
-            if self.current_command.get('strafe_left', False):
-                print("🤖 Strafing Left (from flag)")
+            if command.get('strafe_left', False):
                 vy = 0.05
-            elif self.current_command.get('strafe_right', False):
-                print("🤖 Strafing Right (from flag)")
+            elif command.get('strafe_right', False):
                 vy = -0.05
             
-            if self.current_command.get('turn_left', False):
-                print("🤖 Turning Left (from flag)")
+            if command.get('turn_left', False):
                 yaw = 0.25
-            elif self.current_command.get('turn_right', False):
-                print("🤖 Turning Right (from flag)")
+            elif command.get('turn_right', False):
                 yaw = -0.25
         
+        if vx == 0 and vy == 0 and yaw == 0:
+            log.info("🤖 Stopping (all zeros)", key='publish', every=1.0)
+        else:
+            log.info("🚀 Publishing movement - X: %s, Y: %s, Z: %s", vx, vy, yaw, key='publish', every=1.0)
+        self.requested = (vx, vy, yaw)
+        self.publish_governed()
+
+    def scan_callback(self, scan):
+        """Keep the collision governor's sector minimums up to date"""
+        try:
+            # Threshold / scan angle only matter for lidar mode 1, not used here
+            geometry = self.scan_geometry.get(scan, self.lidar_type, 0.0, 0.0)
+            self.governor.update_scan(geometry, np.asarray(scan.ranges), scan.range_min, scan.range_max,
+                                      time.monotonic())
+        except Exception as e:
+            log.error("❌ Error processing scan: %s", e, key='scan_error', every=5.0)
+
+    def publish_governed(self):
+        """Publish the operator's twist, slowed down by the collision governor if needed"""
+        vx, vy, yaw = self.requested
+        if self.governor is not None and (vx or vy):
+            gx, gy = self.governor.govern(vx, vy, time.monotonic())
+            if (gx, gy) != (vx, vy) and not self.governor.blind:
+                log.info("🧱 Obstacle ahead - speed limited to X: %.3f, Y: %.3f", gx, gy,
+                         key='governor', every=1.0)
+            vx, vy = gx, gy
+        self.publish_twist(vx, vy, yaw)
+
+    def publish_twist(self, vx, vy, yaw):
         self.msg.linear.x = vx
         self.msg.linear.y = vy
         self.msg.angular.z = yaw
-        
-        if vx == 0 and vy == 0 and yaw == 0:
-            print("🤖 Stopping (all zeros)")
-        else:
-            print(f"🚀 Publishing movement - X: {vx}, Y: {vy}, Z: {yaw}")
-        
-        print(f"📡 Publishing to topic: {self.cmd_vel_pub.name}")
         self.cmd_vel_pub.publish(self.msg)
-        print("✅ Movement command published to ROS")
-        print("-" * 60)
+        self.last_twist_publish = time.monotonic()
+
+    def keep_alive(self, now):
+        """Republish the current twist while the operator is connected
+
+        The mux drops teleop after a short timeout, and commands are only
+        published when they change, so an unchanged command is repeated every
+        keepalive seconds. Once commands go stale (and the watchdog has
+        stopped the robot) the repeats stop and other sources can take over.
+        While moving with the collision governor on, the twist is governed
+        and republished every tick instead, as the clearance keeps changing.
+        """
+        with self.state_lock:
+            if self.last_command_time is None or now - self.last_command_time > self.stale_timeout:
+                return
+            if self.governor is not None and (self.requested[0] or self.requested[1]):
+                self.publish_governed()
+                return
+            if now - self.last_twist_publish < self.keepalive:
+                return
+            self.cmd_vel_pub.publish(self.msg)
+            self.last_twist_publish = now
+
+    def check_watchdog(self, now):
+        """Ramp the robot to a stop while commands are stale; called every publish tick"""
+        with self.state_lock:
+            if self.last_command_time is None or now - self.last_command_time <= self.stale_timeout:
+                return
+            if self.watchdog_tripped:
+                pass
+            elif self.msg.linear.x == 0 and self.msg.linear.y == 0 and self.msg.angular.z == 0:
+                return  # Standing still, nothing to stop
+            else:
+                self.watchdog_tripped = True
+                self.watchdog_trips += 1
+                self.ramp_start = now
+                self.ramp_from = (self.msg.linear.x, self.msg.linear.y, self.msg.angular.z)
+                log.warning("⚠️ Watchdog: no command for %.2fs - stopping robot", now - self.last_command_time)
+            
+            if self.msg.linear.x == 0 and self.msg.linear.y == 0 and self.msg.angular.z == 0:
+                return  # Ramp finished
+            scale = max(0.0, 1.0 - (now - self.ramp_start) / self.stop_ramp) if self.stop_ramp > 0 else 0.0
+            self.publish_twist(*(v * scale for v in self.ramp_from))
 
     def on_command_change(self, event):
         """Callback function when command data changes"""
         try:
-            print("\n" + "="*60)
-            print("🔔 FIREBASE EVENT RECEIVED!")
-            print(f"⏰ Time: {time.strftime('%H:%M:%S')}")
-            print(f"📦 Event data type: {type(event.data)}")
-            print(f"📦 Event data: {event.data}")
-            
-            if event.data is None:
-                print("⚠️ Event data is None - ignoring")
+            event_type = getattr(event, 'event_type', 'put')
+            path = getattr(event, 'path', '/')
+            log.debug("🔔 Firebase %s at %s: %s", event_type, path, event.data)
+            self.apply_command('firebase', event_type, path, event.data)
+        except Exception as e:
+            log.exception("❌ Error processing command change: %s", e)
+
+    def on_lan_command(self, payload, reply):
+        """Callback for authenticated commands from the LAN endpoint
+
+        Each packet carries the full command, so it is applied like a put at
+        the root. reply(dict) sends the ack back to the sender.
+        """
+        try:
+            log.debug("📶 LAN command: %s", payload)
+            self.apply_command('lan', 'put', '/', payload, reply)
+        except Exception as e:
+            log.exception("❌ Error processing LAN command: %s", e)
+
+    def apply_command(self, source, event_type, path, data, reply=None):
+        """Patch the shared command state from either source and queue a publish"""
+        with self.state_lock:
+            now = time.monotonic()
+            if source == 'lan':
+                self.last_lan_time = now
+                self.lan_commands += 1
+            elif self.last_lan_time is not None and now - self.last_lan_time < self.lan_timeout:
+                self.firebase_ignored += 1
                 return
+            if source != self.command_source:
+                log.info("🔀 Command source: %s", source)
+                if self.command_source is not None:
+                    self.source_switches += 1
+                self.command_source = source
+                self.last_seq = None  # Each source has its own sequence
             
-            previous_command = self.current_command.copy()
-            print(f"📋 Previous command: {previous_command}")
-            
-            if isinstance(event.data, dict):
-                print("✅ Updating command from dict")
-                self.current_command.update(event.data)
-            elif hasattr(event, 'path') and event.path:
-                field_name = event.path.strip('/')
-                print(f"✅ Updating single field: {field_name} = {event.data}")
-                if field_name in self.current_command:
-                    self.current_command[field_name] = event.data
+            self.events_received += 1
+            first = self.events_received == 1
+            changed = self.command.apply(event_type, path, data)
+            if 'seq' in changed:
+                self.track_sequence({'seq': self.command.seq, 'timestamp': self.command.timestamp}, now, reply)
+            if self.last_command_time is not None:
+                self.max_command_gap = max(self.max_command_gap, now - self.last_command_time)
+            self.last_command_time = now
+            changed_fields = [name for name in changed if name in COMMAND_FIELDS]
+            if changed_fields:
+                if self.dirty:
+                    self.events_coalesced += 1  # Previous change never got published
+                self.dirty = True
+                if log.is_debug():
+                    log.debug("✅ Changed: %s - queued for publish",
+                              ", ".join(f"{name}={getattr(self.command, name)}" for name in changed_fields))
+            elif self.watchdog_tripped:
+                # Fresh command after a trip: republish it even if unchanged
+                self.dirty = True
             else:
-                print("🔍 Fetching current state from Firebase")
-                current_state = self.commands_ref.get()
-                print(f"📥 Fetched state: {current_state}")
-                if current_state and isinstance(current_state, dict):
-                    self.current_command.update(current_state)
-            
-            print(f"📋 New command: {self.current_command}")
+                log.debug("Command unchanged - no movement sent")
+        if first and self.on_first_command is not None:
+            self.on_first_command(source)
+
+    def track_sequence(self, meta, now, reply=None):
+        """Record sender seq / timestamp of an incoming command (state_lock held)"""
+        seq = meta.get('seq')
+        if not isinstance(seq, int):
+            return
+        if self.last_seq is not None:
+            if seq <= self.last_seq:
+                self.seq_reordered += 1
+                log.warning("⚠️ Command seq %s arrived after %s", seq, self.last_seq, key='reorder', every=1.0)
+            elif seq > self.last_seq + 1:
+                self.seq_gaps += seq - self.last_seq - 1
+        self.last_seq = seq
+        
+        sent = meta.get('timestamp')
+        sent = sent / 1000.0 if isinstance(sent, (int, float)) else None
+        if sent is not None:
+            self.latency['network'].add(time.time() - sent)
+        self.pending_seq = (seq, sent, now, reply)
+
+    def record_publish(self, seq_info):
+        """Latencies and ack for the command that was just put into effect"""
+        seq, sent, received, reply = seq_info
+        published_at = time.time()
+        self.latency['dispatch'].add(time.monotonic() - received)
+        if sent is not None:
+            self.latency['end_to_end'].add(published_at - sent)
+        ack = {'seq': seq, 'published_at': int(published_at * 1000)}
+        if reply is not None:
+            # LAN sender: answer directly, a single datagram is cheap
+            reply(ack)
+            return
+        with self.state_lock:
+            self.pending_ack = ack
+
+    def ack_loop(self):
+        """Write the latest ack at most ack_rate times a second"""
+        period = 1.0 / self.ack_rate
+        while self.running and not rospy.is_shutdown():
+            with self.state_lock:
+                ack, self.pending_ack = self.pending_ack, None
+            if ack is not None:
+                try:
+                    self.ack_ref.set(ack)
+                    self.acks_written += 1
+                except Exception as e:
+                    log.error("❌ Error writing ack: %s", e, key='ack_error', every=5.0)
+            time.sleep(period)
+
+    def publish_loop(self):
+        """Publish the latest coalesced command at a fixed rate"""
+        period = 1.0 / self.publish_rate
+        next_tick = time.monotonic()
+        next_status = next_tick + self.status_interval
+        while self.running and not rospy.is_shutdown():
+            with self.state_lock:
+                command = self.command.command() if self.dirty else None
+                self.dirty = False
+                seq_info, self.pending_seq = self.pending_seq, None
+                if command is not None and self.watchdog_tripped:
+                    self.watchdog_tripped = False
+                    log.info("✅ Watchdog: commands resumed")
             
-            if previous_command != self.current_command:
-                print("✅ Command changed - sending movement")
-                self.send_movement_command()
-            else:
-                print("⚠️ Command unchanged - no movement sent")
+            try:
+                if command is not None:
+                    self.send_movement_command(command)
+                else:
+                    self.check_watchdog(time.monotonic())
+                    self.keep_alive(time.monotonic())
+                if seq_info is not None:
+                    # An unchanged command is already in effect, so it is acked too
+                    self.record_publish(seq_info)
+            except Exception as e:
+                log.error("❌ Error publishing command: %s", e, key='publish_error', every=1.0)
             
-            self.display_status()
-            print("="*60 + "\n")
+            if self.status_interval and time.monotonic() >= next_status:
+                next_status += self.status_interval
+                self.display_status()
             
-        except Exception as e:
-            print(f"❌ Error processing command change: {e}")
-            import traceback
-            traceback.print_exc()
+            # Fixed-rate schedule; skip ticks we are already late for
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            time.sleep(delay)
+
+    def get_metrics(self):
+        """Counters for the listener -> publisher pipeline"""
+        return {
+            'events_received': self.events_received,
+            'events_coalesced': self.events_coalesced,
+            'commands_published': self.commands_published,
+            'watchdog_trips': self.watchdog_trips,
+            'seconds_since_command': None if self.last_command_time is None else time.monotonic() - self.last_command_time,
+            'max_command_gap': self.max_command_gap,
+            'last_seq': self.last_seq,
+            'seq_gaps': self.seq_gaps,
+            'seq_reordered': self.seq_reordered,
+            'acks_written': self.acks_written,
+            'command_source': self.command_source,
+            'lan_commands': self.lan_commands,
+            'firebase_ignored': self.firebase_ignored,
+            'source_switches': self.source_switches,
+            'collision_governor': self.governor.metrics() if self.governor is not None else None,
+            'latency': {name: hist.summary() for name, hist in self.latency.items()},
+        }
 
     def display_status(self):
-        """Display current command state"""
-        # os.system('cls' if os.name == 'nt' else 'clear') # Optional: clear screen
-        print("🤖 Firebase JetHexa Controller")
-        print("=" * 60)
-        print(f"Robot ID: {self.robot_id}")
-        print(f"Session: {self.session_code}")
-        print(f"Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print()
+        """Log a periodic summary of the command state and pipeline metrics"""
+        emergency = self.command.get('emergency_stop', False)
+        log.info("🤖 %s | session %s | %s", self.robot_id, self.session_code,
+                 "🔴 EMERGENCY STOP ACTIVE" if emergency else "✅ Normal Operation")
+        log.info("📊 Command vx %.2f vy %.2f yaw %.2f | 🎯 Published x %.2f y %.2f z %.2f",
+                 self.command.get('vx', 0), self.command.get('vy', 0), self.command.get('yaw', 0),
+                 self.msg.linear.x, self.msg.linear.y, self.msg.angular.z)
         
-        emergency = self.current_command.get('emergency_stop', False)
-        e_status = "🔴 EMERGENCY STOP ACTIVE" if emergency else "✅ Normal Operation"
-        print(f"Status: {e_status}")
-        print()
-        
-        print("📊 Velocity Values:")
-        print(f"    VX: {self.current_command.get('vx', 0):.2f}")
-        print(f"    VY: {self.current_command.get('vy', 0):.2f}")
-        print(f"    Yaw: {self.current_command.get('yaw', 0):.2f}")
-        print()
-        
-        print("🎯 Published Movement:")
-        print(f"    Linear X:  {self.msg.linear.x:.2f}")
-        print(f"    Linear Y:  {self.msg.linear.y:.2f}")
-        print(f"    Angular Z: {self.msg.angular.z:.2f}")
-        print("\n" + "=" * 60)
+        metrics = self.get_metrics()
+        log.info("📈 Events: %d received, %d coalesced, %d published | 🐕 %d watchdog trips, max gap %.2fs",
+                 metrics['events_received'], metrics['events_coalesced'], metrics['commands_published'],
+                 metrics['watchdog_trips'], metrics['max_command_gap'])
+        log.info("🔢 Seq: last %s, %d missed, %d out of order, %d acks",
+                 metrics['last_seq'], metrics['seq_gaps'], metrics['seq_reordered'], metrics['acks_written'])
+        log.info("🔀 Source: %s | %d LAN commands, %d Firebase events ignored, %d switches",
+                 metrics['command_source'], metrics['lan_commands'], metrics['firebase_ignored'],
+                 metrics['source_switches'])
+        governor = metrics['collision_governor']
+        if governor is not None:
+            log.info("🧱 Governor: %d checks, %d interventions (%d stops), mean reduction %.0f%%, %d without scan",
+                     governor['checks'], governor['interventions'], governor['stops'],
+                     governor['mean_reduction'] * 100, governor['no_scan'])
+        for name, summary in metrics['latency'].items():
+            if summary['count']:
+                log.info("⏱️ Latency %s: p50 %sms, p99 %sms, max %sms",
+                         name, summary['p50_ms'], summary['p99_ms'], summary['max_ms'])
+        suppressed = {key: counts[1] for key, counts in log.counts.items() if counts[1]}
+        if suppressed:
+            log.info("🔇 Rate-limited log lines: %s", suppressed)
+
+    def publish_lan_key(self, key, port):
+        """Hand the LAN command endpoint's key to operators through the session"""
+        try:
+            db.reference(f'sessions/{self.session_code}/lan').set({'key': key, 'port': port})
+            return True
+        except Exception as e:
+            log.error("❌ Error publishing LAN key: %s", e)
+            return False
+
+    def clear_commands(self):
+        """Delete the latest command left in the session (before start_listening)"""
+        try:
+            self.commands_ref.delete()
+            log.info("🧹 Cleared old commands of session %s", self.session_code)
+        except Exception as e:
+            log.error("❌ Error clearing old commands: %s", e)
 
     def start_listening(self):
         """Start listening for command changes"""
-        print("🔄 Starting Firebase JetHexa controller...")
-        print(f"🔄 Monitoring commands for robot: {self.robot_id}")
-        print(f"📍 Listening on session: {self.session_code}")
-        print(f"📂 Firebase path: sessions/{self.session_code}/robot_commands/latest")
-        print("✅ Robot already standing - ready for teleoperation")
+        log.info("🔄 Starting Firebase JetHexa controller...")
+        log.info("🔄 Monitoring commands for robot: %s", self.robot_id)
+        log.info("📂 Firebase path: sessions/%s/robot_commands/latest", self.session_code)
+        log.info("✅ Robot already standing - ready for teleoperation")
         
         # Check what's currently in Firebase at this path
-        print("\n🔍 Checking current Firebase data...")
+        log.info("🔍 Checking current Firebase data...")
         try:
             current_data = self.commands_ref.get()
-            print(f"📦 Current data at path: {current_data}")
+            log.info("📦 Current data at path: %s", current_data)
             if current_data is None:
-                print("⚠️ WARNING: Path exists but data is None!")
-                print("   This means Unity might be writing to a different path")
-                print(f"   or hasn't written to: sessions/{self.session_code}/robot_commands/latest yet")
+                log.warning("⚠️ WARNING: Path exists but data is None!")
+                log.warning("   This means Unity might be writing to a different path")
+                log.warning("   or hasn't written to: sessions/%s/robot_commands/latest yet", self.session_code)
                 
                 # Check the entire session structure
-                print("\n🔍 Checking entire session structure...")
+                log.info("🔍 Checking entire session structure...")
                 session_ref = db.reference(f'sessions/{self.session_code}')
                 session_data = session_ref.get()
-                print(f"📦 Session data: {session_data}")
                 
                 if session_data:
-                    print("✅ Session exists! Structure:")
                     import json
-                    print(json.dumps(session_data, indent=2))
+                    log.info("✅ Session exists! Structure:\n%s", json.dumps(session_data, indent=2))
                 else:
-                    print("❌ Session doesn't exist yet - waiting for Unity to connect...")
+                    log.warning("❌ Session doesn't exist yet - waiting for Unity to connect...")
         except Exception as e:
-            print(f"❌ Error reading Firebase: {e}")
+            log.error("❌ Error reading Firebase: %s", e)
         
-        print("\n" + "="*60)
-        print("🎧 LISTENING FOR FIREBASE COMMANDS...")
-        print("="*60 + "\n")
+        log.info("🎧 LISTENING FOR FIREBASE COMMANDS...")
+        
+        self.running = True
+        self.publish_thread = threading.Thread(target=self.publish_loop, daemon=True)
+        self.publish_thread.start()
+        log.info("⏱️ Publishing commands at %.0f Hz", self.publish_rate)
+        self.ack_thread = threading.Thread(target=self.ack_loop, daemon=True)
+        self.ack_thread.start()
         
         self.commands_ref.listen(self.on_command_change)
         
@@ -233,16 +520,18 @@ class FirebaseJetHexaController:
             while not rospy.is_shutdown():
                 time.sleep(0.1)
         except KeyboardInterrupt:
-            print("\n\n👋 Stopping Firebase JetHexa controller...")
+            log.info("👋 Stopping Firebase JetHexa controller...")
+        
+        self.running = False
+        self.publish_thread.join(timeout=1)
+        self.ack_thread.join(timeout=1)
+        log.info("📈 Final metrics: %s", self.get_metrics())
         
         # Send stop command
-        self.msg.linear.x = 0.0
-        self.msg.linear.y = 0.0
-        self.msg.angular.z = 0.0
-        self.cmd_vel_pub.publish(self.msg)
+        self.publish_twist(0.0, 0.0, 0.0)
         
         try:
             firebase_admin.delete_app(firebase_admin.get_app())
-            print("✅ Firebase connection closed")
+            log.info("✅ Firebase connection closed")
         except:
             pass
@@ -0,0 +1,191 @@
+import time
+
+FORWARD = "forward"
+TURN_LEFT = "turn_left"
+TURN_RIGHT = "turn_right"
+STOP = "stop"
+STEER = "steer"
+CRUISE = "cruise"
+
+# traveling() arguments for each motion of the obstacle avoidance mode
+GAITS = {
+    FORWARD: dict(
+        gait=1,           # RIPPER gait
+        stride=40.0,      # stride 40mm
+        height=15.0,      # step height 15mm
+        direction=0,      # forward
+        rotation=0.0,     # no rotation
+        time=1,           # time per step
+        steps=0,          # continuous walking
+        interrupt=True,
+        relative_height=False
+    ),
+    TURN_LEFT: dict(
+        gait=1,
+        stride=30.0,
+        height=15.0,
+        direction=0,
+        rotation=0.6,     # positive rotation = left turn
+        time=0.8,
+        steps=4,          # turn for 4 steps
+        interrupt=True,
+        relative_height=False
+    ),
+    TURN_RIGHT: dict(
+        gait=1,
+        stride=30.0,
+        height=15.0,
+        direction=0,
+        rotation=-0.6,    # negative rotation = right turn
+        time=0.8,
+        steps=4,          # turn for 4 steps
+        interrupt=True,
+        relative_height=False
+    ),
+    STOP: dict(gait=0),
+}
+
+
+def steer_params(stride, rotation):
+    """Continuous forward gait with a proportional rotation (VFH steering)"""
+    return dict(GAITS[FORWARD], stride=stride, rotation=rotation)
+
+
+# Mode 5 cruise: stride (mm) and step time (s) from crawling to full speed
+CRUISE_STRIDE = (15.0, 40.0)
+CRUISE_TIME = (1.2, 0.7)
+
+
+def cruise_params(fraction):
+    """Continuous forward gait for a speed fraction in [0, 1]
+
+    Stride grows and step time shrinks together. Both are quantised (5 mm,
+    0.05 s) so small changes in clearance don't count as a new command.
+    """
+    fraction = min(max(fraction, 0.0), 1.0)
+    stride = CRUISE_STRIDE[0] + fraction * (CRUISE_STRIDE[1] - CRUISE_STRIDE[0])
+    step_time = CRUISE_TIME[0] + fraction * (CRUISE_TIME[1] - CRUISE_TIME[0])
+    return dict(GAITS[FORWARD], stride=5.0 * round(stride / 5), time=round(step_time * 20) / 20)
+
+
+def gait_speed(params):
+    """Nominal forward speed (m/s) of a continuous gait; 0 for stepped or stopped gaits"""
+    if params.get("gait", 0) == 0 or params.get("steps", 0) != 0 or not params.get("time"):
+        return 0.0
+    return params.get("stride", 0.0) / 1000.0 / params["time"]
+
+
+class GaitCommander:
+    """Calls traveling() only when the requested motion actually changes
+
+    Continuous gaits (steps=0) keep running on the controller, so asking for the
+    same one again is suppressed until keepalive seconds have passed since it
+    was last sent (keepalive <= 0 never resends). Stepped gaits end on their own
+    and stop is an explicit operator action, so those are always sent.
+    """
+
+    def __init__(self, send, keepalive=0.0):
+        self.send = send
+        self.keepalive = keepalive
+        self.current = None
+        self.current_params = None
+        self.last_sent = 0.0
+        self.sent = 0
+        self.suppressed = 0
+
+    def request(self, motion, params=None, now=None):
+        """Ask for motion (a GAITS key); returns True if traveling() was called"""
+        params = GAITS[motion] if params is None else params
+        now = time.monotonic() if now is None else now
+        continuous = motion != STOP and params.get("steps", 0) == 0
+        if continuous and (motion, params) == (self.current, self.current_params) and not self._keepalive_due(now):
+            self.suppressed += 1
+            return False
+        self.send(**params)
+        self.current = motion
+        self.current_params = params
+        self.last_sent = now
+        self.sent += 1
+        return True
+
+    def refresh(self, now=None):
+        """Resend the current continuous gait if its keep-alive is due"""
+        now = time.monotonic() if now is None else now
+        if self.current is None or self.current == STOP or self.current_params.get("steps", 0) != 0:
+            return False
+        if not self._keepalive_due(now):
+            return False
+        self.send(**self.current_params)
+        self.last_sent = now
+        self.sent += 1
+        return True
+
+    def reset(self):
+        """Forget the current motion, e.g. after something else moved the robot"""
+        self.current = None
+        self.current_params = None
+
+    def _keepalive_due(self, now):
+        return self.keepalive > 0 and now - self.last_sent >= self.keepalive
+
+
+def gait_duration(params):
+    """Seconds a stepped gait runs on the controller (steps x time per step)"""
+    return params.get("steps", 0) * params.get("time", 0)
+
+
+class TurnMonitor:
+    """Tracks a stepped turn until it has finished
+
+    By default the turn ends settle seconds after its gait duration. When yaw
+    rate feedback (odometry) is available it ends as soon as the robot has
+    rotated and then been still for settle seconds, whichever comes first.
+    While the turn runs, observe() keeps the latest "still blocked?" estimate
+    from the scans so the next decision can be made the moment it ends.
+    """
+
+    def __init__(self, settle=0.2, still_rate=0.05):
+        self.settle = settle
+        self.still_rate = still_rate
+        self.reset()
+
+    def reset(self):
+        self.active = False
+        self.deadline = 0.0
+        self.rotated = False
+        self.still_since = None
+        self.observed = False
+        self.obstacle = None
+
+    def start(self, params, now):
+        self.reset()
+        self.active = True
+        self.deadline = now + gait_duration(params) + self.settle
+
+    def observe(self, obstacle):
+        """Record the obstacle (or None if clear) seen by a scan during the turn"""
+        self.observed = True
+        self.obstacle = obstacle
+
+    def update_yaw_rate(self, yaw_rate, now):
+        """Feed controller/odometry yaw rate; returns True if this ended the turn"""
+        if not self.active:
+            return False
+        if abs(yaw_rate) > self.still_rate:
+            self.rotated = True
+            self.still_since = None
+            return False
+        if not self.rotated:
+            return False
+        if self.still_since is None:
+            self.still_since = now
+        if now - self.still_since >= self.settle:
+            self.active = False
+            return True
+        return False
+
+    def finished(self, now):
+        """True once the turn is over (or if none was running)"""
+        if self.active and now >= self.deadline:
+            self.active = False
+        return not self.active
@@ -0,0 +1,66 @@
+import bisect
+import math
+import threading
+
+
+class LatencyHistogram:
+    """Log-binned histogram of latencies in seconds
+
+    Bins are spaced bins_per_decade per decade from lowest to highest; values
+    outside that range land in the first or last bin. Percentiles are
+    reported as the upper edge of the bin they fall in, so they are accurate
+    to one bin width (about 12% with the default 20 bins per decade).
+    """
+
+    def __init__(self, lowest=1e-4, highest=10.0, bins_per_decade=20):
+        decades = math.log10(highest / lowest)
+        n = int(math.ceil(decades * bins_per_decade))
+        self.edges = [lowest * 10 ** (i / bins_per_decade) for i in range(n + 1)]
+        self.counts = [0] * (n + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        seconds = max(seconds, 0.0)
+        i = bisect.bisect_left(self.edges, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def percentile(self, p):
+        """Upper bin edge below which p percent of samples fall (None if empty)"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = p / 100.0 * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= target and c:
+                    return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+            return self.max
+
+    def summary(self):
+        """count / mean / p50 / p90 / p99 / max in milliseconds"""
+        if self.count == 0:
+            return {'count': 0}
+        ms = lambda s: round(s * 1000, 2)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count),
+            'p50_ms': ms(self.percentile(50)),
+            'p90_ms': ms(self.percentile(90)),
+            'p99_ms': ms(self.percentile(99)),
+            'max_ms': ms(self.max),
+        }
@@ -0,0 +1,138 @@
+import numpy as np
+
+# Half width of the corridor in front of the robot that counts as "in the way" (metres)
+CORRIDOR_HALF_WIDTH = 0.3
+# Tracking ignores returns closer than this (robot's own legs/body)
+TRACK_MIN_DIST = 0.25
+# Tracking mode 2 only follows points in front of the lidar
+TRACK_MIN_X = 0.04
+
+
+class ScanGeometry:
+    """Per-beam lookup tables for one scan layout and one set of mode 1 parameters
+
+    cos/sin already include the RPLIDAR 180 degree flip, so projecting a scan
+    is two multiplications. The scan-angle test only depends on the beam
+    direction and is precomputed as the list of beams inside the sector.
+    """
+
+    def __init__(self, angle_min, angle_increment, n, flip, threshold, scan_angle):
+        angles = angle_min + np.arange(n) * angle_increment
+        sign = -1.0 if flip else 1.0
+        self.cos = sign * np.cos(angles)
+        self.sin = sign * np.sin(angles)
+        self.threshold = threshold
+
+        sector = np.abs(np.arctan2(self.sin, self.cos)) < scan_angle / 2
+        self.sector_idx = np.flatnonzero(sector)
+
+        # Furthest range at which a beam in the sector can still land inside the
+        # corridor box. Only used as a prefilter (with a little slack for float32
+        # rounding), the exact x/y tests run on whatever passes it.
+        cos = self.cos[self.sector_idx]
+        sin = np.abs(self.sin[self.sector_idx])
+        with np.errstate(divide='ignore'):
+            reach_x = np.where(cos > 0, threshold / cos, np.inf)
+            reach_y = np.where(sin > 0, CORRIDOR_HALF_WIDTH / sin, np.inf)
+        self.sector_reach = np.minimum(reach_x, reach_y) * (1 + 1e-6)
+
+        # Forward-pointing beams of the sector and how far each can reach
+        # before leaving the corridor sideways, for the forward clearance of mode 5
+        self.front_idx = self.sector_idx[self.cos[self.sector_idx] > 0]
+        with np.errstate(divide='ignore'):
+            self.front_reach = CORRIDOR_HALF_WIDTH / np.abs(self.sin[self.front_idx]) * (1 + 1e-6)
+
+    def project(self, ranges, range_min, range_max):
+        """Project ranges to float32 x/y arrays, matching LaserProjection.projectLaser
+
+        Beams outside [range_min, range_max) (including NaN/inf) are dropped.
+        """
+        valid = (ranges >= range_min) & (ranges < range_max)
+        r = ranges[valid]
+        x = (r * self.cos[valid]).astype(np.float32)
+        y = (r * self.sin[valid]).astype(np.float32)
+        return x, y
+
+    def find_obstacle(self, ranges, range_min, range_max):
+        """Return (x, y) of the closest point in the forward corridor, or None if clear
+
+        A point is an obstacle when it is inside the corridor, no further than
+        threshold ahead and within +-scan_angle/2 of straight ahead. "Closest"
+        means smallest x; ties resolve to the first beam. Only beams inside the
+        scan sector are looked at.
+        """
+        idx = self.sector_idx
+        r = ranges[idx]
+        hit = (r >= range_min) & (r < range_max) & (r <= self.sector_reach)
+        if not hit.any():
+            return None
+        idx = idx[hit]
+        r = r[hit]
+        x = (r * self.cos[idx]).astype(np.float32)
+        y = (r * self.sin[idx]).astype(np.float32)
+        mask = (np.abs(y) < CORRIDOR_HALF_WIDTH) & (x <= self.threshold)
+        if not mask.any():
+            return None
+        ox = x[mask]
+        i = int(np.argmin(ox))
+        return float(ox[i]), float(y[mask][i])
+
+    def forward_clearance(self, ranges, range_min, range_max):
+        """(x, y) of the nearest return in the corridor straight ahead, any distance; None if clear
+
+        Like find_obstacle() only beams inside the scan sector count, and
+        returns within TRACK_MIN_DIST (legs / body) are ignored.
+        """
+        idx = self.front_idx
+        r = ranges[idx]
+        hit = (r >= max(range_min, TRACK_MIN_DIST)) & (r < range_max) & (r <= self.front_reach)
+        if not hit.any():
+            return None
+        idx = idx[hit]
+        r = r[hit]
+        x = r * self.cos[idx]
+        y = r * self.sin[idx]
+        mask = np.abs(y) < CORRIDOR_HALF_WIDTH
+        if not mask.any():
+            return None
+        i = int(np.argmin(np.where(mask, x, np.inf)))
+        return float(x[i]), float(y[i])
+
+
+class GeometryCache:
+    """Keeps the ScanGeometry for the current scan layout and parameters
+
+    The tables are rebuilt only when the key (angle_min, angle_increment,
+    beam count, lidar type, threshold, scan angle) changes.
+    """
+
+    def __init__(self):
+        self._key = None
+        self._geometry = None
+        self.rebuilds = 0
+
+    def get(self, scan, lidar_type, threshold, scan_angle):
+        key = (scan.angle_min, scan.angle_increment, len(scan.ranges), lidar_type, threshold, scan_angle)
+        if key != self._key:
+            self._geometry = ScanGeometry(
+                scan.angle_min, scan.angle_increment, len(scan.ranges),
+                "RPLIDAR" in lidar_type, threshold, scan_angle
+            )
+            self._key = key
+            self.rebuilds += 1
+        return self._geometry
+
+
+def track_points(x, y, min_x=None):
+    """Points the tracking modes may follow: further than TRACK_MIN_DIST
+
+    min_x additionally discards points that are not in front of the lidar.
+    Beam order is preserved, so the result can be segmented into clusters.
+    """
+    if min_x is not None:
+        keep = x > min_x
+        x = x[keep]
+        y = y[keep]
+    dist = np.sqrt(x * x + y * y, dtype=np.float64)
+    keep = dist > TRACK_MIN_DIST
+    return x[keep], y[keep]
@@ -0,0 +1,119 @@
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+ROOT_LOGGER = "jethexa"
+
+_listener = None
+_base_level = logging.INFO
+
+
+def setup_logging(level=None, stream=None):
+    """Send all jethexa.* loggers through a queue to a background writer thread
+
+    The level comes from the argument, else JETHEXA_LOG_LEVEL, else INFO, and
+    can be changed later with set_level() or by sending the process SIGUSR1,
+    which toggles between that level and DEBUG. Safe to call more than once.
+    """
+    global _listener, _base_level
+    if _listener is not None:
+        return
+    level = level or os.environ.get("JETHEXA_LOG_LEVEL", "INFO")
+    _base_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s] %(message)s", "%H:%M:%S"))
+    q = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(q, handler)
+    _listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.addHandler(logging.handlers.QueueHandler(q))
+    root.setLevel(_base_level)
+    root.propagate = False  # rospy configures the root logger for rosout
+
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, _toggle_debug)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_level(level):
+    """Change the level of every jethexa logger at runtime"""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logging.getLogger(ROOT_LOGGER).setLevel(level)
+
+
+def _toggle_debug(signum, frame):
+    root = logging.getLogger(ROOT_LOGGER)
+    set_level(_base_level if root.level == logging.DEBUG else logging.DEBUG)
+    root.warning("Log level now %s", logging.getLevelName(root.level))
+
+
+class RateLimitedLogger:
+    """Logger wrapper with optional per-key rate limiting
+
+    Passing key= and every= to a log call emits that message at most once per
+    every seconds; the rest are counted and the count is appended to the next
+    message that goes out. Arguments are only formatted when a record is
+    actually emitted, so filtered calls in hot paths stay cheap.
+    """
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+        self._lock = threading.Lock()
+        self._last = {}
+        self._suppressed = {}
+        self.counts = {}
+
+    def log(self, level, msg, *args, key=None, every=None):
+        if not self.logger.isEnabledFor(level):
+            return
+        if key is not None:
+            now = time.monotonic()
+            with self._lock:
+                emitted, suppressed = self.counts.get(key, (0, 0))
+                if every and now - self._last.get(key, -every) < every:
+                    self.counts[key] = (emitted, suppressed + 1)
+                    self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                    return
+                self._last[key] = now
+                self.counts[key] = (emitted + 1, suppressed)
+                skipped = self._suppressed.pop(key, 0)
+            if skipped:
+                msg = f"{msg} (+{skipped} suppressed)"
+        self.logger.log(level, msg, *args)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args):
+        self.logger.exception(msg, *args)
+
+    def is_debug(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+
+def get_logger(name):
+    return RateLimitedLogger(name)
@@ -0,0 +1,73 @@
+import rospy
+import geometry_msgs.msg as geo_msg
+import std_msgs.msg as std_msg
+from jethexa_controller_interfaces.msg import Traveling
+
+# Command sources of command_mux.py, highest priority first
+ESTOP = "estop"
+LIDAR_SAFETY = "lidar_safety"
+TELEOP = "teleop"
+AUTONOMY = "autonomy"
+SOURCES = (ESTOP, LIDAR_SAFETY, TELEOP, AUTONOMY)
+
+MUX_NAMESPACE = "command_mux"
+ESTOP_TOPIC = MUX_NAMESPACE + "/estop"
+ACTIVE_TOPIC = MUX_NAMESPACE + "/active"
+
+# Seconds a source keeps control after its last message (0 = until released).
+# A lidar safety turn lasts up to steps * time = 3.2 s and autonomy only
+# resends a continuous gait every 2 s (gait keep-alive). A stepped gait or a
+# stop holds control only for its own duration plus STEPPED_HOLD_MARGIN
+# (within the timeout), and a source can give control back early by
+# publishing on <prefix>/release.
+DEFAULT_TIMEOUTS = {
+    ESTOP: 0.0,
+    LIDAR_SAFETY: 3.5,
+    TELEOP: 0.5,
+    AUTONOMY: 2.5,
+}
+STEPPED_HOLD_MARGIN = 0.5
+
+
+def source_timeout(source):
+    """Timeout of a source as configured on the mux node (~timeouts/<source>)"""
+    return rospy.get_param(f"/{MUX_NAMESPACE}/timeouts/{source}", DEFAULT_TIMEOUTS[source])
+
+
+def source_prefix(source):
+    """Topic prefix a source publishes its cmd_vel / traveling under"""
+    return f"{MUX_NAMESPACE}/{source}"
+
+
+class MuxInput:
+    """Publishes one source's commands into the mux
+
+    Offers the cmd_vel() / traveling() / cmd_vel_pub subset of the
+    jethexa_controller client, so it can stand in for it, plus release().
+    """
+
+    def __init__(self, source):
+        self.source = source
+        prefix = source_prefix(source)
+        self.cmd_vel_pub = rospy.Publisher(prefix + "/cmd_vel", geo_msg.Twist, queue_size=1)
+        self.traveling_pub = rospy.Publisher(prefix + "/traveling", Traveling, queue_size=1)
+        self.release_pub = rospy.Publisher(prefix + "/release", std_msg.Empty, queue_size=1)
+
+    def cmd_vel(self, x, y, z):
+        msg = geo_msg.Twist()
+        msg.linear.x = x
+        msg.linear.y = y
+        msg.angular.z = z
+        self.cmd_vel_pub.publish(msg)
+
+    def traveling(self, **kwargs):
+        self.traveling_pub.publish(Traveling(**kwargs))
+
+    def release(self):
+        """Give up control now instead of when the source times out"""
+        self.release_pub.publish(std_msg.Empty())
+
+
+def estop_publisher():
+    """Latched publisher for the e-stop source (True = engaged)"""
+    return rospy.Publisher(ESTOP_TOPIC, std_msg.Bool, queue_size=1, latch=True)
@@ -1,34 +1,237 @@
 import requests
+import random
+import threading
 import time
 import json
-from ..config import LAMBDA_ENDPOINT, ROBOT_ID
+import os
+import tempfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from ..config import (
+    LAMBDA_ENDPOINT, ROBOT_ID, SESSION_CACHE_PATH, SESSION_MIN_REMAINING,
+    HTTP_RETRIES, HTTP_BREAKER_FAILURES, HTTP_BREAKER_RESET, INTERNET_RETRY_MAX,
+)
+from .log import get_logger
 
-def check_internet():
-    """Check if internet connection is available"""
+log = get_logger("network")
+
+ROUTE_TABLE = "/proc/net/route"
+# Link states of an interface we can send through ("unknown": drivers that don't report it)
+LINK_UP = ("up", "unknown")
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling an endpoint whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after failures failures in a row
+
+    While open, calls fail at once with CircuitOpenError. After reset_timeout
+    seconds one call is let through (half open): it closes the circuit if it
+    succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, name, failures=3, reset_timeout=30.0):
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.misses = 0
+        self.opened = None
+        self.trial = False  # A half-open call is in flight
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened is None:
+                return True
+            if self.trial or time.monotonic() - self.opened < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.opened is not None:
+                log.info("✅ %s is reachable again", self.name)
+            self.misses = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.misses += 1
+            if self.trial or (self.opened is None and self.misses >= self.failures):
+                if self.opened is None:
+                    log.warning("⛔ %s failed %d times in a row, pausing calls for %.0f s",
+                                self.name, self.misses, self.reset_timeout)
+                self.opened = time.monotonic()
+            self.trial = False
+
+
+class HttpClient:
+    """One pooled keep-alive requests.Session for every call to the cloud
+
+    Connection errors are retried by urllib3 for any method (nothing was
+    sent); read errors and 502/503/504 only for idempotent methods, so a
+    registration is never made twice. Every endpoint (URL) has its own
+    CircuitBreaker; connection errors, timeouts and 5xx count as failures.
+    """
+
+    def __init__(self, retries=HTTP_RETRIES, breaker_failures=HTTP_BREAKER_FAILURES,
+                 breaker_reset=HTTP_BREAKER_RESET, pool_size=4):
+        retry = dict(total=retries, connect=retries, read=retries, status=retries, backoff_factor=0.3,
+                     status_forcelist=(502, 503, 504), raise_on_status=False)
+        idempotent = frozenset(("GET", "HEAD", "OPTIONS"))
+        try:
+            retry = Retry(allowed_methods=idempotent, **retry)
+        except TypeError:  # urllib3 < 1.26
+            retry = Retry(method_whitelist=idempotent, **retry)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        with self._lock:
+            if url not in self.breakers:
+                self.breakers[url] = CircuitBreaker(url, self.breaker_failures, self.breaker_reset)
+            return self.breakers[url]
+
+    def request(self, method, url, gated=True, **kwargs):
+        """session.request() behind the endpoint's circuit breaker
+
+        gated=False skips the check for an open circuit (connectivity probes)
+        and only reports successes to the breaker, so failing probes while
+        offline don't hold registration back once the link is up.
+        """
+        breaker = self.breaker(url)
+        if gated and not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {url}")
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:  # Connection errors and timeouts, after urllib3's retries
+            if gated:
+                breaker.failure()
+            raise
+        if response.status_code >= 500:
+            if gated:
+                breaker.failure()
+        else:
+            breaker.success()
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The shared HttpClient, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def backoff_delays(base=0.5, cap=INTERNET_RETRY_MAX):
+    """Endless full-jitter exponential backoff: uniform(0, min(cap, base * 2**n)), at least base / 2"""
+    attempt = 0
+    while True:
+        yield max(random.uniform(0, min(cap, base * 2 ** attempt)), base / 2)
+        attempt = min(attempt + 1, 16)
+
+
+def default_route(route_table=ROUTE_TABLE):
+    """Interface of the IPv4 default route, None if there is none"""
+    try:
+        with open(route_table) as f:
+            next(f)  # Header
+            for line in f:
+                fields = line.split()
+                # Destination 0.0.0.0 with the RTF_UP flag set
+                if len(fields) > 3 and fields[1] == "00000000" and int(fields[3], 16) & 0x1:
+                    return fields[0]
+    except (OSError, StopIteration, ValueError):
+        pass
+    return None
+
+
+def link_up():
+    """True if there is a default route through an interface whose link is up
+
+    Only reads /proc and /sys, so it can be polled often without traffic.
+    If the route table can't be read at all we can't tell, and say yes.
+    """
+    if not os.path.exists(ROUTE_TABLE):
+        return True
+    iface = default_route()
+    if iface is None:
+        return False
     try:
-        requests.get("https://www.google.com", timeout=5)
+        with open(f"/sys/class/net/{iface}/operstate") as f:
+            return f.read().strip() in LINK_UP
+    except OSError:
         return True
-    except requests.ConnectionError:
+
+
+def check_internet():
+    """Check if the registration Lambda is reachable
+
+    Sends a CORS preflight (OPTIONS, answered without touching DynamoDB) over
+    the shared client, which leaves a warm connection for register_session().
+    Any HTTP answer below 500 counts as reachable.
+    """
+    if not link_up():
         return False
+    try:
+        response = get_client().request("OPTIONS", LAMBDA_ENDPOINT, gated=False, timeout=5)
+        return response.status_code < 500
     except Exception:
         return False
 
 def wait_for_internet():
-    """Wait for internet connection with status messages"""
-    print("🔍 Checking internet connection...")
+    """Wait for internet connection with status messages
+
+    Polls the default route / link state until there is one (no traffic),
+    then probes the Lambda with jittered exponential backoff, starting over
+    if the link drops.
+    """
+    log.info("🔍 Checking internet connection...")
     
-    while not check_internet():
-        print("❌ No internet connection. Retrying in 3 seconds...")
-        time.sleep(3)
+    delays = backoff_delays()
+    waiting_for_link = False
+    while True:
+        if not link_up():
+            if not waiting_for_link:
+                log.info("📶 No network link yet. Waiting for a default route...")
+                waiting_for_link = True
+            time.sleep(0.5)
+            delays = backoff_delays()  # Probe quickly once it is back
+            continue
+        waiting_for_link = False
+        if check_internet():
+            break
+        delay = next(delays)
+        log.warning("❌ Lambda not reachable. Retrying in %.1f seconds...", delay, key='unreachable', every=30.0)
+        time.sleep(delay)
     
-    print("✅ Internet connected!")
+    log.info("✅ Internet connected!")
     return True
 
 def register_session():
     """Call Lambda to get session code"""
     try:
-        print(f"📡 Registering robot {ROBOT_ID} with AWS...")
-        response = requests.post(
+        log.info("📡 Registering robot %s with AWS...", ROBOT_ID)
+        response = get_client().post(
             LAMBDA_ENDPOINT,
             json={"robot_id": ROBOT_ID},
             timeout=10
@@ -39,17 +242,101 @@ def register_session():
             session_code = data['session_code']
             agora_channel = data['agora_channel']
             
-            print(f"✅ Session Code: {session_code}")
-            print(f"📺 Agora Channel: {agora_channel}")
+            log.info("✅ Session Code: %s", session_code)
+            log.info("📺 Agora Channel: %s", agora_channel)
             
+            if 'expires_at' in data:
+                save_session(session_code, agora_channel, data['expires_at'])
             return session_code, agora_channel
         else:
-            print(f"❌ Registration failed: {response.text}")
+            log.error("❌ Registration failed: %s", response.text)
             return None, None
             
     except json.JSONDecodeError as e:
-        print(f"❌ JSON decode error: {e}")
+        log.error("❌ JSON decode error: %s", e)
         return None, None
     except Exception as e:
-        print(f"❌ Error registering: {e}")
+        log.error("❌ Error registering: %s", e)
+        return None, None
+
+def save_session(session_code, agora_channel, expires_at, path=SESSION_CACHE_PATH):
+    """Store the session for the next boot (atomically: a crash leaves the old file or the new one)"""
+    session = {
+        'robot_id': ROBOT_ID,
+        'session_code': session_code,
+        'agora_channel': agora_channel,
+        'expires_at': int(expires_at),
+    }
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".session-", suffix=".tmp")  # Mode 0600
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(session, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError as e:
+        log.warning("⚠️ Could not cache session: %s", e)
+
+def load_cached_session(path=SESSION_CACHE_PATH):
+    """Session cached by save_session(), or None if there is none worth trying
+
+    Our clock may be off right after boot, so this is only a first filter;
+    validate_session() asks the Lambda.
+    """
+    try:
+        with open(path) as f:
+            session = json.load(f)
+        if session.get('robot_id') != ROBOT_ID or not session.get('session_code'):
+            return None
+        remaining = int(session['expires_at']) / 1000 - time.time()
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return session if remaining >= SESSION_MIN_REMAINING else None
+
+def clear_cached_session(path=SESSION_CACHE_PATH):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log.warning("⚠️ Could not remove cached session: %s", e)
+
+def validate_session(session):
+    """Ask the Lambda whether a cached session can be reused
+
+    Returns (session_code, agora_channel), or (None, None) if it is gone,
+    taken, about to expire or the Lambda could not be asked.
+    """
+    session_code = session['session_code']
+    try:
+        log.info("📡 Checking cached session %s with AWS...", session_code)
+        response = get_client().post(
+            LAMBDA_ENDPOINT,
+            json={"action": "validate", "robot_id": ROBOT_ID, "session_code": session_code},
+            timeout=5
+        )
+        if response.status_code != 200:
+            log.error("❌ Session check failed: %s", response.text)
+            return None, None
+        data = response.json()
+    except Exception as e:
+        log.error("❌ Error checking session: %s", e)
+        return None, None
+
+    if not data.get('valid'):
+        log.info("🔄 Cached session %s can't be reused (%s)", session_code, data.get('reason'))
+        clear_cached_session()
+        return None, None
+    # Judge what is left by the Lambda's clock, not ours
+    remaining = (int(data['expires_at']) - int(data.get('server_time', time.time() * 1000))) / 1000
+    if remaining < SESSION_MIN_REMAINING:
+        log.info("🔄 Cached session %s expires in %.0f s, not reusing it", session_code, remaining)
         return None, None
+    log.info("♻️ Reusing session %s (%.0f min left)", session_code, remaining / 60)
+    return session_code, data.get('agora_channel', session['agora_channel'])
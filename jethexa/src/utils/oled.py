@@ -71,6 +71,12 @@ class OLEDDisplay:
         self.display_thread = threading.Thread(target=display_loop, daemon=True)
         self.display_thread.start()
     
+    def show(self, message):
+        """Change the message of the continuous display (drawn right away if it runs)"""
+        self.current_message = message
+        if self.running:
+            self.display_message(message)
+
     def stop_display(self):
         """Stop continuous display"""
         self.running = False
@@ -0,0 +1,139 @@
+import numpy as np
+
+FILTER_NONE = 0
+FILTER_MEDIAN = 1
+FILTER_MIN_OF_K = 2
+
+MAX_HISTORY = 10
+
+
+def _load_ranges(row, ranges, range_min, range_max, invalid, tmp):
+    """Copy ranges into row with invalid readings set to +inf, without allocating"""
+    np.copyto(row, ranges)
+    # invalid = not (range_min <= r < range_max); NaN compares False
+    np.greater_equal(row, range_min, out=invalid)
+    np.less(row, range_max, out=tmp)
+    np.logical_and(invalid, tmp, out=invalid)
+    np.logical_not(invalid, out=invalid)
+    np.copyto(row, np.inf, where=invalid)
+
+
+class ScanHistory:
+    """Fixed-size ring buffer of the last N range arrays with a per-beam filter
+
+    The filtered range of a beam is the k-th smallest of its last N readings,
+    so a return only counts as close once k scans agree on it and a single
+    noisy point is ignored. FILTER_MEDIAN uses k = (N + 1) // 2, FILTER_MIN_OF_K
+    uses the configured k. Invalid readings (outside [range_min, range_max),
+    NaN) are stored as +inf, i.e. "nothing there".
+
+    All buffers are allocated when the first scan of a given size arrives; after
+    that push() does not allocate. The first scan fills the whole ring so the
+    filter is valid from the start.
+    """
+
+    def __init__(self, size=3, mode=FILTER_NONE, k=2):
+        self.configure(size, mode, k)
+
+    def configure(self, size, mode, k):
+        self.size = int(size)
+        self.mode = int(mode)
+        self.k = (self.size + 1) // 2 if self.mode == FILTER_MEDIAN else min(max(int(k), 1), self.size)
+        self.reset()
+
+    def reset(self):
+        """Forget buffered scans; the next push() refills the ring"""
+        self._buf = None
+
+    @property
+    def enabled(self):
+        return self.mode != FILTER_NONE and self.size > 1
+
+    def _allocate(self, n):
+        # Beam-major so partitioning runs along contiguous rows
+        self._buf = np.empty((n, self.size), dtype=np.float64)
+        self._scratch = np.empty((n, self.size), dtype=np.float64)
+        self._row = np.empty(n, dtype=np.float64)
+        self._invalid = np.empty(n, dtype=bool)
+        self._tmp = np.empty(n, dtype=bool)
+        self._out = np.empty(n, dtype=np.float64)
+        self._head = 0
+
+    def push(self, ranges, range_min, range_max):
+        """Add one scan and return the filtered ranges (reused between calls)"""
+        n = len(ranges)
+        fresh = self._buf is None or self._buf.shape[0] != n
+        if fresh:
+            self._allocate(n)
+
+        row = self._row
+        _load_ranges(row, ranges, range_min, range_max, self._invalid, self._tmp)
+
+        if fresh:
+            self._buf[:] = row[:, np.newaxis]
+        else:
+            self._buf[:, self._head] = row
+        self._head = (self._head + 1) % self.size
+
+        np.copyto(self._scratch, self._buf)
+        self._scratch.partition(self.k - 1, axis=1)
+        np.copyto(self._out, self._scratch[:, self.k - 1])
+        return self._out
+
+
+class ScanChangeDetector:
+    """Tells whether a scan differs enough from the last processed one to act on
+
+    A beam has changed when its range moved by more than tolerance metres or
+    it turned valid / invalid; invalid readings compare as +inf, so two of
+    them are equal. A scan is worth processing once at least min_beams beams
+    have changed, when its size differs, after invalidate(), and when the last
+    processed scan is more than max_age seconds old, so time-driven decisions
+    still get refreshed. Only processed scans become the new reference, so a
+    slow drift adds up until it crosses the tolerance. min_beams <= 0
+    processes every scan.
+
+    Buffers are allocated when the first scan of a given size arrives; after
+    that changed() does not allocate.
+    """
+
+    def __init__(self, tolerance=0.05, min_beams=3, max_age=1.0):
+        self.tolerance = tolerance
+        self.min_beams = int(min_beams)
+        self.max_age = max_age
+        self._ref = None
+        self.invalidate()
+
+    def invalidate(self):
+        """Make the next scan count as changed, e.g. after a mode or parameter change"""
+        self._stamp = None
+
+    def _allocate(self, n):
+        self._ref = np.empty(n, dtype=np.float64)
+        self._row = np.empty(n, dtype=np.float64)
+        self._delta = np.empty(n, dtype=np.float64)
+        self._moved = np.empty(n, dtype=bool)
+        self._tmp = np.empty(n, dtype=bool)
+        self._stamp = None
+
+    def changed(self, ranges, range_min, range_max, now):
+        """True if this scan should be processed; it then becomes the reference"""
+        if self.min_beams <= 0:
+            return True
+        if self._ref is None or self._ref.shape[0] != len(ranges):
+            self._allocate(len(ranges))
+
+        row = self._row
+        _load_ranges(row, ranges, range_min, range_max, self._moved, self._tmp)
+        if self._stamp is not None and now - self._stamp < self.max_age:
+            # inf - inf is NaN and compares False: both invalid counts as unchanged
+            with np.errstate(invalid='ignore'):
+                np.subtract(row, self._ref, out=self._delta)
+                np.abs(self._delta, out=self._delta)
+                np.greater(self._delta, self.tolerance, out=self._moved)
+            if np.count_nonzero(self._moved) < self.min_beams:
+                return False
+
+        self._ref, self._row = row, self._ref
+        self._stamp = now
+        return True
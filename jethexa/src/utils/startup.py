@@ -0,0 +1,165 @@
+import socket
+import threading
+import time
+
+from .log import get_logger
+
+log = get_logger("startup")
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+TIMED_OUT = "timeout"
+SKIPPED = "skipped"
+FINISHED = (READY, FAILED, TIMED_OUT, SKIPPED)
+
+
+class Step:
+    """One node of a StartupGraph (see StartupGraph.add)"""
+
+    def __init__(self, name, run, deps, ready, timeout, optional):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.ready = ready
+        self.timeout = timeout
+        self.optional = optional
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class StartupGraph:
+    """Runs startup steps as a dependency graph instead of a fixed sequence
+
+    A step starts in its own thread as soon as all of its dependencies are
+    ready. It is ready once run() has returned and its ready() probe (if any)
+    returns True; the probe is polled every poll seconds and an exception
+    counts as "not yet". A step that is not ready within timeout seconds of
+    starting (None = no limit) times out, and its thread is left to finish in
+    the background. Dependents of a step that failed, timed out or was
+    skipped are skipped, unless that step is optional.
+    """
+
+    def __init__(self, poll=0.1):
+        self.poll = poll
+        self.steps = {}
+        self.started = None
+        self._cond = threading.Condition()
+
+    def add(self, name, run=None, deps=(), ready=None, timeout=30.0, optional=False):
+        """Add a step; its dependencies must already have been added"""
+        if name in self.steps:
+            raise ValueError("Duplicate startup step {}".format(name))
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError("Startup step {} depends on unknown step {}".format(name, dep))
+        self.steps[name] = Step(name, run, deps, ready, timeout, optional)
+        return self.steps[name]
+
+    def result(self, name):
+        """Return value of a step's run(), None unless it became ready"""
+        step = self.steps[name]
+        return step.result if step.status == READY else None
+
+    def ready(self, name):
+        return self.steps[name].status == READY
+
+    def running(self, name):
+        """True while a step is running; False once it finished or timed out (abandoned)"""
+        return self.steps[name].status == RUNNING
+
+    def run(self):
+        """Run every step; True if all non-optional steps became ready"""
+        self.started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                changed = False
+                for step in self.steps.values():
+                    if step.status == PENDING:
+                        deps = [self.steps[dep] for dep in step.deps]
+                        if any(dep.status in FINISHED and dep.status != READY and not dep.optional for dep in deps):
+                            step.status = SKIPPED
+                            step.started = step.finished = now
+                            log.warning("⏭️ %s skipped", step.name)
+                            changed = True
+                        elif all(dep.status in FINISHED for dep in deps):
+                            self._start(step, now)
+                            changed = True
+                    elif step.status == RUNNING and step.timeout is not None and now - step.started >= step.timeout:
+                        step.status = TIMED_OUT
+                        step.finished = now
+                        log.error("⏱️ %s not ready after %.1f s", step.name, step.timeout)
+                        changed = True
+                if changed:
+                    continue
+                if all(step.status in FINISHED for step in self.steps.values()):
+                    break
+                deadlines = [step.started + step.timeout for step in self.steps.values()
+                             if step.status == RUNNING and step.timeout is not None]
+                self._cond.wait(max(min(deadlines) - now, 0.0) if deadlines else None)
+        return all(step.status == READY or step.optional for step in self.steps.values())
+
+    def report(self):
+        """(name, status, start offset, duration) of every step, in seconds"""
+        return [
+            (step.name, step.status,
+             None if step.started is None else step.started - self.started, step.duration)
+            for step in self.steps.values()
+        ]
+
+    def _start(self, step, now):
+        step.status = RUNNING
+        step.started = now
+        threading.Thread(target=self._execute, args=(step,), name="startup-" + step.name, daemon=True).start()
+
+    def _execute(self, step):
+        try:
+            result = step.run() if step.run is not None else None
+            step.result = result
+            while step.ready is not None and not self._probe(step):
+                if step.status != RUNNING:
+                    return  # Timed out meanwhile
+                time.sleep(self.poll)
+            status, error = READY, None
+        except Exception as e:
+            status, error = FAILED, e
+        with self._cond:
+            if step.status != RUNNING:
+                return
+            step.status = status
+            step.error = error
+            step.finished = time.monotonic()
+            self._cond.notify_all()
+        if error is None:
+            log.info("✅ %s ready in %.1f s", step.name, step.duration)
+        elif step.optional:
+            log.warning("⚠️ %s failed: %s", step.name, error)
+        else:
+            log.error("❌ %s failed: %s", step.name, error)
+
+    @staticmethod
+    def _probe(step):
+        try:
+            return bool(step.ready())
+        except Exception:
+            return False
+
+
+def port_open(port, host="127.0.0.1", timeout=0.2):
+    """True if something accepts TCP connections on host:port"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
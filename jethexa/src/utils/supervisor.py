@@ -0,0 +1,322 @@
+import collections
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from .log import get_logger
+
+log = get_logger("supervisor")
+
+STARTING = "starting"  # Launched, liveness probe not passed yet
+RUNNING = "running"
+STOPPING = "stopping"  # Exited or unhealthy, its process group being killed
+BACKOFF = "backoff"    # Waiting to be started again
+STOPPED = "stopped"
+FAILED = "failed"      # Out of restarts
+
+# Restart policies
+RESTART_ALWAYS = "always"
+RESTART_ON_FAILURE = "on-failure"  # Not after a clean exit (code 0)
+RESTART_NEVER = "never"
+
+
+class ManagedProcess:
+    """One child process of a Supervisor (see Supervisor.add)"""
+
+    def __init__(self, name, cmd, probe, grace, probe_interval, probe_failures, restart, backoff,
+                 max_backoff, stable_after, max_restarts, requires, log_lines, stop_timeout, env, cwd,
+                 echo, on_running):
+        self.name = name
+        self.cmd = list(cmd)
+        self.probe = probe
+        self.grace = grace
+        self.probe_interval = probe_interval
+        self.probe_failures = probe_failures
+        self.restart = restart
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.max_restarts = max_restarts
+        self.requires = tuple(requires)
+        self.stop_timeout = stop_timeout
+        self.env = env
+        self.cwd = cwd
+        self.echo = echo
+        self.on_running = on_running
+        self.logs = collections.deque(maxlen=log_lines)
+        self.popen = None
+        self.state = STOPPED
+        self.restarts = 0
+        self.failures = 0  # In a row, drives the backoff
+        self.started = None
+        self.next_start = 0.0
+        self.next_probe = 0.0
+        self.probe_misses = 0
+        self.last_exit = None
+        self.killer = None  # Thread killing it after a failure
+
+    @property
+    def pid(self):
+        return self.popen.pid if self.popen is not None else None
+
+    def uptime(self, now=None):
+        if self.state not in (STARTING, RUNNING) or self.started is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self.started
+
+    def tail(self, lines=20):
+        """Last captured output lines (stdout and stderr)"""
+        return list(self.logs)[-lines:]
+
+
+class Supervisor:
+    """Owns child processes and keeps them alive
+
+    Every child runs in its own session / process group with stdout and
+    stderr captured into a ring buffer of its last log_lines lines. A child
+    that exits, or whose probe() fails probe_failures times in a row (after
+    a grace period from launch), is stopped with its whole process group and
+    started again after a backoff that doubles up to max_backoff. The
+    backoff resets once a child has stayed up for stable_after seconds. A
+    child is only started while everything it requires is running, and
+    it is restarted along with them. Stopping a child sends SIGINT to its
+    group (roslaunch shuts its nodes down cleanly on it), then SIGTERM and
+    SIGKILL if it is still there after stop_timeout; whatever is left of the
+    group once the child has exited is killed. That can take a while, so
+    it never happens with the lock held: failed children are killed in a
+    thread of their own, and the backoff starts once they are gone. Probes
+    run without the lock too, so a slow probe only delays the checks of
+    the monitor thread, never status() or stop().
+
+    echo also copies a child's output to our stdout, prefixed with its name.
+    on_running(proc) is called in a thread of its own every time the child
+    comes up. Every status_interval seconds (None = never) the state of all
+    children is logged.
+    """
+
+    def __init__(self, tick=0.5, status_interval=None):
+        self.tick = tick
+        self.status_interval = status_interval
+        self.processes = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def add(self, name, cmd, probe=None, grace=30.0, probe_interval=2.0, probe_failures=3,
+            restart=RESTART_ALWAYS, backoff=1.0, max_backoff=30.0, stable_after=60.0, max_restarts=None,
+            requires=(), log_lines=200, stop_timeout=5.0, env=None, cwd=None, echo=False, on_running=None):
+        if restart not in (RESTART_ALWAYS, RESTART_ON_FAILURE, RESTART_NEVER):
+            raise ValueError("Invalid restart policy {}".format(restart))
+        with self._lock:
+            if name in self.processes:
+                raise ValueError("Process {} is already supervised".format(name))
+            for required in requires:
+                if required not in self.processes:
+                    raise ValueError("Process {} requires unknown process {}".format(name, required))
+            proc = ManagedProcess(name, cmd, probe, grace, probe_interval, probe_failures, restart, backoff,
+                                  max_backoff, stable_after, max_restarts, requires, log_lines,
+                                  stop_timeout, env, cwd, echo, on_running)
+            self.processes[name] = proc
+            return proc
+
+    def start(self, name):
+        """Start a child now (it must have been added) and keep it running"""
+        with self._lock:
+            self._launch(self.processes[name])
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._monitor, name="supervisor", daemon=True)
+            self._thread.start()
+
+    def running(self, name):
+        """True once the child is up and its probe (if any) has passed"""
+        return self.processes[name].state == RUNNING
+
+    def stop(self, name=None):
+        """Stop one child, or all of them in reverse order of adding"""
+        with self._lock:
+            names = [name] if name is not None else list(reversed(self.processes))
+            if name is None:
+                self._stopping.set()
+            procs = [self.processes[n] for n in names]
+            for proc in procs:
+                if proc.state in (STARTING, RUNNING):
+                    log.info("⏹️ Stopping %s", proc.name)
+                proc.state = STOPPED  # Nothing restarts it from here on
+        for proc in procs:
+            killer = proc.killer
+            if killer is not None:
+                killer.join()
+            self._kill(proc)
+
+    def status(self):
+        """One dict per child: state, pid, restarts, uptime (s), last exit code"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {'name': proc.name, 'state': proc.state, 'pid': proc.pid, 'restarts': proc.restarts,
+                 'uptime': round(proc.uptime(now), 1), 'last_exit': proc.last_exit}
+                for proc in self.processes.values()
+            ]
+
+    def summary(self):
+        return ", ".join("{name}: {state} up {uptime:.0f} s, {restarts} restarts".format(**s)
+                         for s in self.status())
+
+    def _launch(self, proc):
+        proc.popen = subprocess.Popen(
+            proc.cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,  # Own process group, torn down as a whole
+            env=proc.env,
+            cwd=proc.cwd,
+        )
+        proc.state = STARTING
+        proc.started = time.monotonic()
+        proc.next_probe = proc.started
+        proc.probe_misses = 0
+        threading.Thread(target=self._read_output, args=(proc, proc.popen), name="log-" + proc.name,
+                         daemon=True).start()
+        log.info("▶️ Started %s (pid %d)", proc.name, proc.popen.pid)
+        if proc.probe is None:
+            self._up(proc)
+
+    def _up(self, proc):
+        proc.state = RUNNING
+        if proc.on_running is not None:
+            threading.Thread(target=proc.on_running, args=(proc,), daemon=True).start()
+
+    @staticmethod
+    def _read_output(proc, popen):
+        for line in iter(popen.stdout.readline, b''):
+            text = line.decode(errors='replace').rstrip()
+            proc.logs.append(text)
+            if proc.echo:
+                print("[{}] {}".format(proc.name, text), flush=True)
+        popen.stdout.close()
+
+    def _kill(self, proc):
+        popen = proc.popen
+        if popen is None:
+            return
+        if popen.poll() is None:
+            for sig, wait in ((signal.SIGINT, proc.stop_timeout), (signal.SIGTERM, 2.0), (signal.SIGKILL, 2.0)):
+                try:
+                    os.killpg(popen.pid, sig)
+                except ProcessLookupError:
+                    break
+                try:
+                    popen.wait(timeout=wait)
+                    break
+                except subprocess.TimeoutExpired:
+                    continue
+        proc.last_exit = popen.poll()
+        # Whatever outlived the leader (nodes of a crashed roslaunch, background jobs)
+        try:
+            os.killpg(popen.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _monitor(self):
+        next_status = time.monotonic() + (self.status_interval or 0)
+        while not self._stopping.wait(self.tick):
+            due = []
+            with self._lock:
+                now = time.monotonic()
+                if self.status_interval and now >= next_status:
+                    next_status = now + self.status_interval
+                    log.info("📋 %s", self.summary())
+                for proc in self.processes.values():
+                    try:
+                        if self._check(proc, now):
+                            due.append((proc, proc.popen))
+                    except Exception as e:
+                        log.error("❌ Supervising %s: %s", proc.name, e, key='check_' + proc.name, every=10.0)
+            for proc, popen in due:
+                try:
+                    healthy = bool(proc.probe())
+                except Exception:
+                    healthy = False
+                with self._lock:
+                    # Restarted or stopped while we probed: the result is for another process
+                    if proc.popen is popen and proc.state in (STARTING, RUNNING):
+                        self._probed(proc, healthy, time.monotonic())
+
+    def _check(self, proc, now):
+        """Called with the lock held; True if proc's probe is due (run it without the lock)"""
+        if proc.state == BACKOFF:
+            if now >= proc.next_start and all(self.running(required) for required in proc.requires):
+                proc.restarts += 1
+                self._launch(proc)
+            return
+        if proc.state not in (STARTING, RUNNING):
+            return
+
+        code = proc.popen.poll()
+        if code is not None:
+            proc.last_exit = code
+            if code == 0 and proc.restart == RESTART_ON_FAILURE:
+                proc.state = STOPPED
+                log.info("⏹️ %s exited cleanly", proc.name)
+                return
+            self._failed(proc, "exited with code {}".format(code), now)
+            return
+        if proc.probe is None or now < proc.next_probe:
+            return False
+        proc.next_probe = now + proc.probe_interval
+        return True
+
+    def _probed(self, proc, healthy, now):
+        """Act on a probe result (lock held)"""
+        if healthy:
+            proc.probe_misses = 0
+            if proc.state == STARTING:
+                log.info("✅ %s is up after %.1f s", proc.name, now - proc.started)
+                self._up(proc)
+            return
+        if proc.state == STARTING and now - proc.started < proc.grace:
+            return
+        proc.probe_misses += 1
+        if proc.probe_misses >= proc.probe_failures:
+            self._failed(proc, "failed its liveness probe {} times".format(proc.probe_misses), now)
+
+    def _failed(self, proc, reason, now):
+        """Called with the lock held"""
+        log.warning("⚠️ %s %s after %.1f s; last output:\n  %s", proc.name, reason, now - proc.started,
+                    "\n  ".join(proc.tail(10)) or "(none)")
+        if now - proc.started >= proc.stable_after:
+            proc.failures = 0
+        proc.failures += 1
+        if proc.restart == RESTART_NEVER or (proc.max_restarts is not None and proc.restarts >= proc.max_restarts):
+            self._stop_async(proc, None)
+        else:
+            self._stop_async(proc, min(proc.backoff * 2 ** (proc.failures - 1), proc.max_backoff))
+        # Children of this one lost what they run against: restart them with it
+        for other in self.processes.values():
+            if proc.name in other.requires and other.state in (STARTING, RUNNING):
+                log.info("🔁 Restarting %s with %s", other.name, proc.name)
+                self._stop_async(other, 0.0)
+
+    def _stop_async(self, proc, delay):
+        """Kill proc in a thread, then back off for delay seconds (None = give up)"""
+        proc.state = STOPPING
+
+        def run():
+            self._kill(proc)
+            with self._lock:
+                if proc.state != STOPPING:
+                    return  # stop() got to it meanwhile
+                if delay is None:
+                    proc.state = FAILED
+                    log.error("❌ Giving up on %s after %d restarts", proc.name, proc.restarts)
+                else:
+                    proc.state = BACKOFF
+                    proc.next_start = time.monotonic() + delay
+                    if delay:
+                        log.info("🔁 Restarting %s in %.1f s", proc.name, delay)
+
+        proc.killer = threading.Thread(target=run, name="stop-" + proc.name, daemon=True)
+        proc.killer.start()
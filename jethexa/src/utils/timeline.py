@@ -0,0 +1,161 @@
+import datetime
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .log import get_logger
+
+log = get_logger("timeline")
+
+# Event kinds; compare_boots.py leaves out WAIT (e.g. waiting for a button press)
+PHASE = "phase"
+STEP = "step"
+IMPORT = "import"
+MARK = "mark"
+WAIT = "wait"
+
+
+def _boot_id():
+    """Kernel boot id, shared by every process of one boot ('' if unknown)"""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _uptime():
+    """Seconds since the kernel booted (None if unknown)"""
+    try:
+        with open("/proc/uptime") as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BootTimeline:
+    """Monotonic timeline of one process's startup, saved as a JSON report
+
+    Create it as early as possible in the process: event times are reported
+    in seconds since then, together with the system uptime at that moment,
+    so reports of the processes of one boot (same boot_id) line up. Events
+    are spans (begin/end, phase(), span()) or instants (mark()). save() can
+    be called repeatedly; it rewrites the same file atomically, and only the
+    keep newest reports of a process are kept in report_dir.
+    """
+
+    def __init__(self, process, report_dir=None, keep=20):
+        self.origin = time.monotonic()
+        self.process = process
+        self.report_dir = report_dir
+        self.keep = keep
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self.uptime = _uptime()
+        self.boot_id = _boot_id()
+        self.events = []
+        self._open = {}
+        self._lock = threading.Lock()
+        self.path = None
+
+    def begin(self, name, kind=PHASE):
+        with self._lock:
+            self._open[name] = (kind, time.monotonic())
+
+    def end(self, name, status="ok", **detail):
+        """Close a span opened with begin(); ignored if it is not open"""
+        now = time.monotonic()
+        with self._lock:
+            opened = self._open.pop(name, None)
+        if opened is not None:
+            self.span(name, opened[1], now, kind=opened[0], status=status, **detail)
+
+    @contextmanager
+    def phase(self, name, kind=PHASE):
+        self.begin(name, kind)
+        try:
+            yield
+        except BaseException as e:
+            self.end(name, status="error", error=str(e))
+            raise
+        self.end(name)
+
+    def span(self, name, start, end, kind=PHASE, status="ok", **detail):
+        """Add a span from time.monotonic() start / end values"""
+        event = dict(name=name, kind=kind, start=round(start - self.origin, 4),
+                     end=round(end - self.origin, 4), status=status)
+        event.update(detail)
+        with self._lock:
+            self.events.append(event)
+
+    def mark(self, name, kind=MARK, **detail):
+        """Instant event; kind=WAIT for one that waits on a person (left out of comparisons)"""
+        now = time.monotonic()
+        self.span(name, now, now, kind=kind, **detail)
+
+    def preload(self, *modules):
+        """Import modules one by one, timing each
+
+        A module that fails to import is recorded as unavailable and not raised,
+        so the regular import statement that follows still reports it.
+        """
+        for module in modules:
+            start = time.monotonic()
+            try:
+                importlib.import_module(module)
+                status = "ok"
+            except Exception:
+                status = "unavailable"
+            self.span("import " + module, start, time.monotonic(), kind=IMPORT, status=status)
+
+    def report(self):
+        with self._lock:
+            events = sorted(self.events, key=lambda e: (e['start'], e['end']))
+            still_open = sorted(self._open)
+        return {
+            'process': self.process,
+            'pid': os.getpid(),
+            'boot_id': self.boot_id,
+            'started_at': self.started_at,
+            'uptime_at_start': self.uptime,
+            'elapsed': round(time.monotonic() - self.origin, 4),
+            'open': still_open,
+            'events': events,
+        }
+
+    def save(self):
+        """Write the report (atomically); returns its path, None if it could not be written"""
+        if self.report_dir is None:
+            return None
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            if self.path is None:
+                stamp = self.started_at.replace(':', '').replace('-', '')
+                self.path = os.path.join(self.report_dir, f"{self.process}-{stamp}-{os.getpid()}.json")
+                self._prune()
+            fd, tmp = tempfile.mkstemp(dir=self.report_dir, prefix=".boot-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.report(), f, indent=2)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            log.warning("⚠️ Could not write boot report: %s", e, key='boot_report', every=60.0)
+            return None
+        return self.path
+
+    def _prune(self):
+        reports = sorted(name for name in os.listdir(self.report_dir)
+                         if name.startswith(self.process + "-") and name.endswith(".json"))
+        for name in reports[:max(len(reports) - self.keep + 1, 0)]:
+            os.remove(os.path.join(self.report_dir, name))
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+def segment(x, y, gap, min_points=1):
+    """Split beam-ordered points into clusters wherever neighbours are > gap apart
+
+    Returns (cx, cy, counts): cluster centroids and sizes, dropping clusters
+    with fewer than min_points points. The last and first clusters are merged
+    when the scan wraps around through the same object.
+    """
+    n = len(x)
+    if n == 0:
+        empty = np.empty(0)
+        return empty, empty, np.empty(0, dtype=np.intp)
+
+    dx = np.diff(x)
+    dy = np.diff(y)
+    split = (dx * dx + dy * dy) > gap * gap
+    labels = np.concatenate(([0], np.cumsum(split)))
+    last = labels[-1]
+    if last > 0:
+        wx = x[0] - x[-1]
+        wy = y[0] - y[-1]
+        if wx * wx + wy * wy <= gap * gap:
+            labels[labels == last] = 0
+
+    counts = np.bincount(labels)
+    keep = counts >= min_points
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cx = np.bincount(labels, weights=x) / counts
+        cy = np.bincount(labels, weights=y) / counts
+    return cx[keep], cy[keep], counts[keep]
+
+
+class KalmanTrack:
+    """Constant-velocity Kalman filter on a 2D position, state [x, y, vx, vy]"""
+
+    def __init__(self, x, y, now, accel_std=0.5, meas_std=0.03):
+        self.state = np.array([x, y, 0.0, 0.0])
+        self.cov = np.diag([meas_std ** 2, meas_std ** 2, 1.0, 1.0])
+        self.accel_var = accel_std ** 2
+        self.meas_var = meas_std ** 2
+        self.stamp = now
+        self.missed = 0
+
+    @property
+    def position(self):
+        return float(self.state[0]), float(self.state[1])
+
+    def predict(self, now):
+        dt = max(now - self.stamp, 0.0)
+        self.stamp = now
+        if dt == 0:
+            return
+        f = np.eye(4)
+        f[0, 2] = f[1, 3] = dt
+        # Piecewise constant white acceleration
+        dt2 = dt * dt
+        q = self.accel_var * np.array([
+            [dt2 * dt2 / 4, 0, dt2 * dt / 2, 0],
+            [0, dt2 * dt2 / 4, 0, dt2 * dt / 2],
+            [dt2 * dt / 2, 0, dt2, 0],
+            [0, dt2 * dt / 2, 0, dt2],
+        ])
+        self.state = f @ self.state
+        self.cov = f @ self.cov @ f.T + q
+
+    def update(self, x, y):
+        # H picks the position, so H P H^T and P H^T are sub-blocks of P
+        innovation = np.array([x, y]) - self.state[:2]
+        s = self.cov[:2, :2] + np.eye(2) * self.meas_var
+        gain = self.cov[:, :2] @ np.linalg.inv(s)
+        self.state = self.state + gain @ innovation
+        self.cov = self.cov - gain @ self.cov[:2, :]
+        self.missed = 0
+
+
+class TargetTracker:
+    """Follows one clustered object across scans
+
+    Each scan is segmented into clusters. An existing track takes the cluster
+    closest to its predicted position within gate metres; otherwise it coasts
+    on the prediction and is dropped after max_missed scans. Without a track,
+    the closest cluster within acquire_range of the robot is picked up.
+    """
+
+    def __init__(self, gap=0.1, min_points=3, gate=0.3, max_missed=5):
+        self.gap = gap
+        self.min_points = min_points
+        self.gate = gate
+        self.max_missed = max_missed
+        self.track = None
+        self.acquired = 0
+        self.lost = 0
+
+    def reset(self):
+        self.track = None
+
+    def update(self, x, y, now, acquire_range):
+        """Feed one scan's points; returns the filtered (x, y) of the target or None"""
+        cx, cy, _ = segment(x, y, self.gap, self.min_points)
+
+        if self.track is not None:
+            self.track.predict(now)
+            px, py = self.track.position
+            if len(cx):
+                d2 = (cx - px) ** 2 + (cy - py) ** 2
+                i = int(np.argmin(d2))
+                if d2[i] <= self.gate * self.gate:
+                    self.track.update(cx[i], cy[i])
+                    return self.track.position
+            self.track.missed += 1
+            if self.track.missed <= self.max_missed:
+                return self.track.position  # Coast on the prediction
+            self.track = None
+            self.lost += 1
+
+        if len(cx):
+            d2 = cx * cx + cy * cy
+            i = int(np.argmin(d2))
+            if d2[i] < acquire_range * acquire_range:
+                self.track = KalmanTrack(float(cx[i]), float(cy[i]), now)
+                self.acquired += 1
+                return self.track.position
+        return None
@@ -0,0 +1,85 @@
+import math
+import numpy as np
+
+
+class VectorFieldHistogram:
+    """Polar obstacle density histogram with free-valley heading selection
+
+    Every beam closer than window metres adds (window - r) / window to the
+    sector it falls in, divided by the number of beams in that sector, so the
+    density of a sector is in [0, 1] whatever the lidar resolution. Sectors
+    below threshold are free; the widest run of free sectors (a valley) wins.
+    """
+
+    def __init__(self, bins=72, window=1.0, threshold=0.05, smoothing=2, wide_valley=18):
+        self.bins = bins
+        self.window = window
+        self.threshold = threshold
+        self.smoothing = smoothing
+        # Valleys wider than this (in bins) are steered through near the goal
+        # direction instead of their centre
+        self.wide_valley = wide_valley
+        self.bin_width = 2 * math.pi / bins
+        self._geometry = None
+        self._bin_idx = None
+        self._beams_per_bin = None
+        self._kernel = np.full(2 * smoothing + 1, 1.0 / (2 * smoothing + 1))
+
+    def build(self, geometry, ranges, range_min, range_max):
+        """Return the smoothed density histogram for one scan"""
+        if geometry is not self._geometry:
+            # Beam -> sector mapping only changes with the scan layout
+            angles = np.arctan2(geometry.sin, geometry.cos)
+            self._bin_idx = ((angles + math.pi) / self.bin_width).astype(np.intp) % self.bins
+            self._beams_per_bin = np.maximum(np.bincount(self._bin_idx, minlength=self.bins), 1)
+            self._geometry = geometry
+
+        hit = (ranges >= range_min) & (ranges < range_max) & (ranges < self.window)
+        weights = (self.window - ranges[hit]) / self.window
+        hist = np.bincount(self._bin_idx[hit], weights=weights, minlength=self.bins) / self._beams_per_bin
+
+        if self.smoothing:
+            s = self.smoothing
+            hist = np.convolve(np.concatenate((hist[-s:], hist, hist[:s])), self._kernel, mode='valid')
+        return hist
+
+    def bin_angle(self, b):
+        """Centre angle (radians, 0 = straight ahead) of sector b"""
+        return -math.pi + (b + 0.5) * self.bin_width
+
+    def select(self, hist, goal=0.0):
+        """Heading (radians) through the widest free valley, or None if fully blocked"""
+        free = hist < self.threshold
+        if free.all():
+            return goal
+        if not free.any():
+            return None
+
+        # Rotate so the histogram starts on a blocked sector; then no valley
+        # wraps around the end and runs can be found with a single diff
+        shift = int(np.argmin(free))
+        rolled = np.roll(free, -shift).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], rolled, [0])))
+        starts = np.flatnonzero(edges == 1)
+        widths = np.flatnonzero(edges == -1) - starts
+        v = int(np.argmax(widths))
+        start = starts[v] + shift
+        width = int(widths[v])
+
+        if width <= self.wide_valley:
+            return self._wrap(self.bin_angle(start + (width - 1) / 2))
+
+        # Wide valley: head for the goal if it is comfortably inside, otherwise
+        # keep half a "wide" valley away from the edge closest to the goal
+        margin = self.wide_valley / 2
+        lo = self.bin_angle(start + margin)
+        hi = self.bin_angle(start + width - 1 - margin)
+        if (goal - lo) % (2 * math.pi) <= hi - lo:
+            return goal
+        if abs(self._wrap(goal - lo)) < abs(self._wrap(goal - hi)):
+            return self._wrap(lo)
+        return self._wrap(hi)
+
+    @staticmethod
+    def _wrap(angle):
+        return (angle + math.pi) % (2 * math.pi) - math.pi
@@ -1,9 +1,16 @@
+import hashlib
+import hmac
 import http.server
+import json
+import secrets
 import socketserver
 import threading
 import time
 from functools import partial
-from ..config import WEB_SERVER_PORT, TEMPLATE_DIR
+from ..config import WEB_SERVER_PORT, TEMPLATE_DIR, LAN_COMMAND_PORT
+from .log import get_logger
+
+log = get_logger("web")
 
 def start_web_server():
     """Start local web server in background thread serving from TEMPLATE_DIR"""
@@ -18,14 +25,121 @@ def start_web_server():
             socketserver.TCPServer.allow_reuse_address = True
             
             with socketserver.TCPServer(("", WEB_SERVER_PORT), Handler) as httpd:
-                print(f"✅ Web server running at http://localhost:{WEB_SERVER_PORT}")
-                print(f"📂 Serving files from: {TEMPLATE_DIR}")
+                log.info("✅ Web server running at http://localhost:%d", WEB_SERVER_PORT)
+                log.info("📂 Serving files from: %s", TEMPLATE_DIR)
                 httpd.serve_forever()
         except Exception as e:
-            print(f"❌ Error starting web server: {e}")
+            log.error("❌ Error starting web server: %s", e, key='web_server', every=5.0)
     
     # Start server in daemon thread so it doesn't block
     server_thread = threading.Thread(target=run_server, daemon=True)
     server_thread.start()
-    print(f"🌐 Web server starting on port {WEB_SERVER_PORT}...")
-    time.sleep(1)  # Give it a moment to start
+    log.info("🌐 Web server starting on port %d...", WEB_SERVER_PORT)
+    return server_thread
+
+
+# LAN command datagrams are a 32-byte HMAC-SHA256 of the body followed by the
+# JSON body. Acks coming back use the same framing. The key is a random secret
+# made per run (new_lan_key()) and handed to operators through the session in
+# Firebase (sessions/<code>/lan). It is not the 6-character PIN: one sniffed
+# packet would be enough to brute-force that offline.
+MAC_SIZE = 32
+# A sender that has been quiet this long may restart its sequence numbers
+# (with a newer timestamp than anything accepted before)
+SEQ_RESET_AFTER = 5.0
+
+
+def new_lan_key():
+    """Random 256-bit key for the LAN command endpoint, as hex"""
+    return secrets.token_hex(32)
+
+
+def sign_packet(key, payload):
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    return hmac.new(str(key).encode(), body, hashlib.sha256).digest() + body
+
+
+def verify_packet(key, packet):
+    """Decoded payload dict of a correctly signed packet, otherwise None"""
+    if len(packet) <= MAC_SIZE:
+        return None
+    mac, body = packet[:MAC_SIZE], packet[MAC_SIZE:]
+    expected = hmac.new(str(key).encode(), body, hashlib.sha256).digest()
+    if not hmac.compare_digest(mac, expected):
+        return None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+class _CommandHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        packet, sock = self.request
+        self.server.handle_packet(packet, sock, self.client_address)
+
+
+class CommandEndpoint(socketserver.UDPServer):
+    """UDP command endpoint for operators on the same network as the robot
+
+    Only packets signed with key (see new_lan_key()) are accepted. A packet whose
+    seq is not newer than the last accepted one is dropped as a replay,
+    unless the sender has been quiet for SEQ_RESET_AFTER seconds and the
+    packet's timestamp is newer than any accepted so far. Accepted
+    payloads go to on_command(payload, reply); reply(dict) sends a signed
+    datagram back to the sender.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, key, on_command, port=LAN_COMMAND_PORT, host=""):
+        super().__init__((host, port), _CommandHandler)
+        self.key = key
+        self.on_command = on_command
+        self.last_seq = None
+        self.last_stamp = None
+        self.last_accepted = 0.0
+        self.accepted = 0
+        self.rejected = 0
+        self.replayed = 0
+
+    def handle_packet(self, packet, sock, address):
+        payload = verify_packet(self.key, packet)
+        if payload is None:
+            self.rejected += 1
+            log.warning("⚠️ Rejected LAN packet from %s", address[0], key='lan_rejected', every=5.0)
+            return
+        now = time.monotonic()
+        seq = payload.get('seq')
+        stamp = payload.get('timestamp')
+        if not isinstance(seq, int) or not isinstance(stamp, (int, float)):
+            self.rejected += 1
+            return
+        if self.last_seq is not None and seq <= self.last_seq:
+            restarted = now - self.last_accepted >= SEQ_RESET_AFTER and stamp > self.last_stamp
+            if not restarted:
+                self.replayed += 1
+                return
+        self.last_seq = seq
+        self.last_stamp = stamp if self.last_stamp is None else max(stamp, self.last_stamp)
+        self.last_accepted = now
+        self.accepted += 1
+
+        def reply(message):
+            try:
+                sock.sendto(sign_packet(self.key, message), address)
+            except OSError as e:
+                log.error("❌ LAN reply failed: %s", e, key='lan_reply', every=5.0)
+        self.on_command(payload, reply)
+
+
+def start_command_endpoint(key, on_command, port=LAN_COMMAND_PORT):
+    """Start the LAN command endpoint in a background thread; returns the server"""
+    try:
+        server = CommandEndpoint(key, on_command, port)
+    except OSError as e:
+        log.error("❌ Error starting LAN command endpoint: %s", e, key='lan_endpoint', every=5.0)
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("📶 LAN command endpoint listening on udp/%d", port)
+    return server